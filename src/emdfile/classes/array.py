@@ -2,12 +2,20 @@
 # Implements the EMD file standard - https://emdatasets.com/format
 
 from typing import Optional,Union
+from numbers import Number
 import numpy as np
 import h5py
-from numbers import Number
 from os.path import basename
 
 from emdfile.classes.tree import Node
+from emdfile.classes.utils import _choose_chunks
+
+# dim vectors up to this size are written with the HDF5 compact layout
+_COMPACT_DIM_BYTES = 1<<15
+
+# concrete numeric scalar types, checked instead of the slower numbers.Number
+# ABC when unpacking dim vectors
+_NUMERIC_TYPES = (int,float,complex,np.number)
 
 class Array(Node):
     """
@@ -201,83 +209,26 @@ class Array(Node):
         self.slicelabels = slicelabels
 
 
-        ## Set dim vectors
-        dim_in_pixels = np.zeros(self.rank, dtype=bool) # flag to help assign dim names and units
-        # if none were passed
-        if self._dims is None:
-            self._dims = [self._unpack_dim(1,self.shape[n]) for n in range(self.rank)]
-            dim_in_pixels[:] = True
-
-        # if some but not all were passed
-        elif len(self._dims)<self.rank:
-            _dims = self._dims
-            N = len(_dims)
-            self._dims = []
-            for n in range(N):
-                dim = self._unpack_dim(_dims[n],self.shape[n])
-                self._dims.append(dim)
-            for n in range(N,self.rank):
-                self._dims.append(self._unpack_dim(1,self.shape[n]))
-                dim_in_pixels[n] = True
-
-        # if all were passed
-        elif len(self._dims)==self.rank:
-            _dims = self._dims
-            self._dims = []
-            for n in range(self.rank):
-                dim = self._unpack_dim(_dims[n],self.shape[n])
-                self._dims.append(dim)
-
-        # otherwise
-        else:
-            raise Exception(f"too many dim vectors were passed - expected {self.rank}, received {len(self._dims)}")
-
-
-        ## set dim vector names
-
-        # if none were passed
-        if self._dim_names is None:
-            self._dim_names = [f"dim{n}" for n in range(self.rank)]
-
-        # if some but not all were passed
-        elif len(self._dim_names)<self.rank:
-            N = len(self._dim_names)
-            self._dim_names = [name for name in self._dim_names] + \
-                             [f"dim{n}" for n in range(N,self.rank)]
-
-        # if all were passed
-        elif len(self._dim_names)==self.rank:
-            pass
-
-        # otherwise
-        else:
-            raise Exception(f"too many dim names were passed - expected {self.rank}, received {len(self._dim_names)}")
+        ## Set dim vectors, names, and units
+        # values which aren't passed are autopopulated: dim vectors with
+        # pixel numbers, names with "dim#", and units with 'pixels' for
+        # dims in pixels and 'unknown' otherwise. These are stored as lists,
+        # so setting one dim doesn't rebuild the whole sequence; the public
+        # properties return immutable tuples
+        shape,rank = self.shape,self.rank
+        N = 0 if self._dims is None else len(self._dims)
+        dims = self._pad_axis_param(
+            self._dims, rank, 'dim vectors', lambda n: 1)
+        self._dims = [self._unpack_dim(dims[n],shape[n]) for n in range(rank)]
+        self._dim_names = self._pad_axis_param(
+            self._dim_names, rank, 'dim names', lambda n: f"dim{n}")
+        self._dim_units = self._pad_axis_param(
+            self._dim_units, rank, 'dim units',
+            lambda n: 'pixels' if n >= N else 'unknown')
 
-
-        ## set dim vector units
-
-        # if none were passed
-        if self._dim_units is None:
-            self._dim_units = [['unknown','pixels'][int(i)] for i in dim_in_pixels]
-
-        # if some but not all were passed
-        elif len(self._dim_units)<self.rank:
-            N = len(self._dim_units)
-            self._dim_units = [units for units in self._dim_units] + \
-                             [['unknown','pixels'][int(dim_in_pixels[i])] for i in range(N,self.rank)]
-
-        # if all were passed
-        elif len(self._dim_units)==self.rank:
-            pass
-
-        # otherwise
-        else:
-            raise Exception(f"too many dim units were passed - expected {self.rank}, received {len(self._dim_units)}")
-
-        # make dim vector params immutable
-        self._dims = tuple(self._dims)
-        self._dim_units = tuple(self._dim_units)
-        self._dim_names = tuple(self._dim_names)
+        # flag linear dim vectors, which are stored compressed in files
+        self._dims_linear = [self._dim_is_linear(self._dims[n],self.shape[n])
+            for n in range(self.rank)]
 
 
 
@@ -286,7 +237,7 @@ class Array(Node):
 
     @property
     def dims(self):
-        return self._dims
+        return tuple(self._dims)
 
     def get_dim(self,n):
         """ Return the n'th dim vector
@@ -320,10 +271,8 @@ class Array(Node):
         assert(isinstance(n,(int,np.integer))), f"Can't set the {n}th dim vector - {n} must be an integer, not type {type(n)}."
         assert(n < len(self._dims)), f"Can't set the {n}th dim vector - {n} must be <= {len(self._dims)-1}"
         length = self.shape[n]
-        new_dim = self._unpack_dim(dim,length)
-        self._dims = list(self._dims)
-        self._dims[n] = new_dim
-        self._dims = tuple(self._dims)
+        self._dims[n] = self._unpack_dim(dim,length)
+        self._dims_linear[n] = self._dim_is_linear(self._dims[n],length)
         if units is not None:
             self.set_dim_units(n,units)
         if name is not None:
@@ -331,7 +280,7 @@ class Array(Node):
 
     @property
     def dim_units(self):
-        return self._dim_units
+        return tuple(self._dim_units)
 
     def get_dim_units(self,n):
         """ Return the n'th dim vector units
@@ -354,13 +303,11 @@ class Array(Node):
         """
         assert(isinstance(n,(int,np.integer))), f"Can't set the {n}th dim vector - {n} must be an integer, not type {type(n)}."
         assert(n < len(self._dims)), f"Can't set the {n}th dim vector - {n} must be <= {len(self._dims)-1}"
-        self._dim_units = list(self._dim_units)
         self._dim_units[n] = units
-        self._dim_units = tuple(self._dim_units)
 
     @property
     def dim_names(self):
-        return self._dim_names
+        return tuple(self._dim_names)
 
     def get_dim_name(self,n):
         """ Get the n'th dim vector name
@@ -383,11 +330,54 @@ class Array(Node):
         """
         assert(isinstance(n,(int,np.integer))), f"Can't set the {n}th dim vector - {n} must be an integer, not type {type(n)}."
         assert(n < len(self._dims)), f"Can't set the {n}th dim vector - {n} must be <= {len(self._dims)-1}"
-        self._dim_names = list(self._dim_names)
         self._dim_names[n] = name
-        self._dim_names = tuple(self._dim_names)
 
 
+    @classmethod
+    def _from_validated(
+        cls,
+        data,
+        name,
+        units,
+        dims,
+        dim_units,
+        dim_names,
+        dims_linear
+        ):
+        """
+        Returns a new non-stack instance, skipping the validation and
+        expansion of the dim parameters done in __init__. `dims`, `dim_units`,
+        `dim_names` and `dims_linear` must already be complete and full
+        length, e.g. taken from an existing Array whose shape matches `data`.
+        """
+        ar = cls.__new__(cls)
+        Node.__init__(ar)
+        ar.data = data
+        ar.name = name
+        ar.units = units
+        ar.is_stack = False
+        ar.slicelabels = None
+        ar._dims = list(dims)
+        ar._dim_units = list(dim_units)
+        ar._dim_names = list(dim_names)
+        ar._dims_linear = list(dims_linear)
+        return ar
+
+    @staticmethod
+    def _pad_axis_param(passed,rank,name,default):
+        """
+        Returns a list of `rank` per-axis values built from `passed`, which
+        may be None or a list of up to `rank` values. Values for the axes
+        n which weren't passed are populated with `default(n)`. `name` is
+        used in the error raised if too many values are passed.
+        """
+        if passed is None:
+            return [default(n) for n in range(rank)]
+        N = len(passed)
+        if N > rank:
+            raise Exception(f"too many {name} were passed - expected {rank}, received {N}")
+        return list(passed) + [default(n) for n in range(N,rank)]
+
     @staticmethod
     def _unpack_dim(dim,length):
         """
@@ -411,14 +401,24 @@ class Array(Node):
         Returns
             the unpacked dim vector
         """
-        # Expand single numbers
-        if isinstance(dim,Number):
+        # Get the length and type of the dim vector; arrays are typed by
+        # their dtype, and single numbers are expanded to [0,number]
+        if isinstance(dim,np.ndarray):
+            N = dim.shape[0]
+            numeric = dim.dtype.kind in 'iufc'
+            # object arrays are typed by their first element
+            if dim.dtype.kind == 'O' and N > 0:
+                numeric = isinstance(dim[0],Number)
+        elif isinstance(dim,_NUMERIC_TYPES):
             dim = [0,dim]
-
-        N = len(dim)
+            N = 2
+            numeric = True
+        else:
+            N = len(dim)
+            numeric = isinstance(dim[0],_NUMERIC_TYPES)
 
         # for string dimensions:
-        if not isinstance(dim[0],Number):
+        if not numeric:
             assert(N == length), f"For non-numerical dims, the dim vector length must match the array dimension length. Recieved a dim vector of length {N} for an array dimension length of {length}."
 
         # For number-like dimensions:
@@ -426,8 +426,12 @@ class Array(Node):
             return dim
         elif N == 2:
             start,step = dim[0],dim[1]-dim[0]
-            stop = start + step*length
-            return np.arange(start,stop,step)
+            return np.linspace(
+                start,
+                start + step*(length-1),
+                length,
+                dtype = np.result_type(start,step)
+            )
         else:
             raise Exception(f"dim vector length must be either 2 or equal to the length of the corresponding array dimension; dim vector length was {dim} and the array dimension length was {length}")
 
@@ -435,6 +439,16 @@ class Array(Node):
         """
         Returns True if a dim is linear, else returns False
         """
+        if length < 2:
+            return True
+        if not isinstance(dim[0],_NUMERIC_TYPES):
+            return False
+        # most non-linear dims can be rejected from their last element,
+        # which equals the endpoint of the linear expansion computed by
+        # _unpack_dim, without expanding the full vector
+        start,step = dim[0],dim[1]-dim[0]
+        if dim[length-1] != start + step*(length-1):
+            return False
         dim_expanded = self._unpack_dim(dim[:2],length)
         return np.array_equal(dim,dim_expanded)
 
@@ -442,14 +456,25 @@ class Array(Node):
 
 
 
-    # Shape properties
+    # Data and shape properties
+
+    @property
+    def data(self):
+        return self._data
+    @data.setter
+    def data(self,x):
+        self._data = x
+        self._shape = None
 
     @property
     def shape(self):
-        if not self.is_stack:
-            return self.data.shape
-        else:
-            return self.data.shape[1:]
+        # cached, as it's read for every axis in many methods
+        if self._shape is None:
+            if not self.is_stack:
+                self._shape = self._data.shape
+            else:
+                self._shape = self._data.shape[1:]
+        return self._shape
 
     @property
     def depth(self):
@@ -460,29 +485,29 @@ class Array(Node):
 
     @property
     def rank(self):
-        if not self.is_stack:
-            return self.data.ndim
-        else:
-            return self.data.ndim - 1
+        return len(self.shape)
 
 
     ## Slicing
 
     def get_slice(self,label,name=None):
         idx = self.slicelabels._dict[label]
-        return Array(
+        return Array._from_validated(
             data = self.data[idx],
             name = name if name is not None else self.name+'_'+label,
             units = self.units,
-            dims = self.dims,
-            dim_units = self.dim_units,
-            dim_names = self.dim_names
+            dims = self._dims,
+            dim_units = self._dim_units,
+            dim_names = self._dim_names,
+            dims_linear = self._dims_linear
         )
 
     def __getitem__(self,x):
-        if isinstance(x,str):
+        # exact type checks keep the common numeric indexing path cheap
+        t = type(x)
+        if t is str or t is np.str_:
             return self.get_slice(x)
-        elif isinstance(x,tuple) and isinstance(x[0],str):
+        elif t is tuple and x and type(x[0]) in (str,np.str_):
             return self.get_slice(x[0])[x[1:]]
         else:
             return self.data[x]
@@ -502,7 +527,7 @@ class Array(Node):
             string += "\n"+space+"with dimensions:"
             string += "\n"
             for n in range(self.rank):
-                string += "\n"+space+f"{self.dim_names[n]} = [{self.dims[n][0]},{self.dims[n][1]},...] {self.dim_units[n]}"
+                string += "\n"+space+f"{self._dim_names[n]} = [{self._dims[n][0]},{self._dims[n][1]},...] {self._dim_units[n]}"
             string += "\n)"
 
         else:
@@ -516,8 +541,8 @@ class Array(Node):
             string += "\n"
             string += "\n" + space + "The Array dimensions are:"
             for n in range(self.rank):
-                string += "\n"+space+f"    {self.dim_names[n]} = [{self.dims[n][0]},{self.dims[n][1]},...] {self.dim_units[n]}"
-                if not self._dim_is_linear(self.dims[n],self.shape[n]):
+                string += "\n"+space+f"    {self._dim_names[n]} = [{self._dims[n][0]},{self._dims[n][1]},...] {self._dim_units[n]}"
+                if not self._dims_linear[n]:
                     string += "  (*non-linear*)"
             string += "\n)"
 
@@ -528,7 +553,19 @@ class Array(Node):
     # HDF5 read/write
 
     # write
-    def to_h5(self,group):
+    def _hash_state(self):
+        state = Node._hash_state(self)
+        del(state['_shape'])
+        return state
+
+    def to_h5(
+        self,
+        group,
+        chunks = 'auto',
+        compression = None,
+        compression_opts = None,
+        shuffle = True
+        ):
         """
         Takes an h5py Group instance and creates a subgroup containing
         this Array, tags indicating its EMD type and Python class,
@@ -536,6 +573,16 @@ class Array(Node):
 
         Accepts:
             group (h5py Group)
+            chunks ('auto', None, True, or tuple): chunk shape of the data
+                array. 'auto' picks chunks of ~1 MiB which keep the trailing
+                axes whole, and stores arrays smaller than this contiguously.
+                Other values are passed to h5py.
+            compression (None or str): HDF5 compression filter for the data
+                array, e.g. 'gzip' or 'lzf'. Note that 'lzf' is only
+                available to readers using h5py.
+            compression_opts: options for the compression filter, e.g. the
+                gzip level, 0-9
+            shuffle (bool): if compressing, apply the shuffle filter first
 
         Returns:
             (h5py Group) the new array's Group
@@ -544,32 +591,49 @@ class Array(Node):
         grp = Node.to_h5(self,group)
 
         # add the data
-        data = grp.create_dataset(
-            "data",
-            shape = self.data.shape,
-            data = self.data
-            #dtype = type(self.data)
-        )
+        ar = self.data
+        # data read lazily from an HDF5 file is copied with H5Ocopy, which
+        # copies the raw chunks without decoding them, unless the layout
+        # or filters are being changed
+        if isinstance(ar,h5py.Dataset) and chunks == 'auto' and compression is None:
+            grp.copy(ar,grp,name="data")
+            data = grp["data"]
+        else:
+            if chunks == 'auto':
+                chunks = _choose_chunks(ar.shape, ar.dtype.itemsize)
+            # native, C-contiguous numpy arrays are handed straight to HDF5
+            # with write_direct, skipping h5py's conversion of `data`
+            direct = isinstance(ar,np.ndarray) and ar.size > 0 and \
+                ar.dtype.isnative and ar.flags['C_CONTIGUOUS']
+            data = grp.create_dataset(
+                "data",
+                shape = ar.shape,
+                dtype = ar.dtype,
+                data = None if direct else ar,
+                chunks = chunks,
+                compression = compression,
+                compression_opts = compression_opts,
+                shuffle = shuffle and compression is not None
+            )
+            if direct:
+                data.write_direct(ar)
         data.attrs.create('units',self.units) # save 'units' but not 'name' - 'name' is the group name
 
         # Add the normal dim vectors
         for n in range(self.rank):
 
             # unpack info
-            dim = self.dims[n]
-            name = self.dim_names[n]
-            units = self.dim_units[n]
-            is_linear = self._dim_is_linear(dim,self.shape[n])
+            dim = self._dims[n]
+            name = self._dim_names[n]
+            units = self._dim_units[n]
+            is_linear = self._dims_linear[n]
 
             # compress the dim vector if it's linear
             if is_linear:
                 dim = dim[:2]
 
             # write
-            dset = grp.create_dataset(
-                f"dim{n}",
-                data = dim
-            )
+            dset = self._write_dim(grp,n,dim)
             dset.attrs.create('name',name)
             dset.attrs.create('units',units)
 
@@ -579,27 +643,45 @@ class Array(Node):
             dim = [s.encode('utf-8') for s in self.slicelabels]
 
             # write
-            dset = grp.create_dataset(
-                f"dim{n}",
-                data = dim
-            )
+            dset = self._write_dim(grp,n,dim)
             dset.attrs.create('name','_labels_')
 
         # Return
         return grp
 
+    @staticmethod
+    def _write_dim(grp,n,dim):
+        """
+        Writes the dim vector `dim` to a new dataset "dim{n}" in `grp`, and
+        returns the dataset. Small dim vectors use the compact layout, which
+        stores their values in the dataset's object header alongside its
+        attributes, rather than in a separately allocated block of the file.
+        """
+        dim = np.asarray(dim)
+        dcpl = None
+        if dim.nbytes <= _COMPACT_DIM_BYTES:
+            dcpl = h5py.h5p.create(h5py.h5p.DATASET_CREATE)
+            dcpl.set_layout(h5py.h5d.COMPACT)
+        return grp.create_dataset(
+            f"dim{n}",
+            data = dim,
+            dcpl = dcpl
+        )
+
 
 
 
     # read
     @classmethod
-    def _get_constructor_args(cls,group):
+    def _get_constructor_args(cls,group,lazy=False):
         """
-        Returns a dictionary of args/values to pass to the class constructor
+        Returns a dictionary of args/values to pass to the class constructor.
+        If `lazy` is True, the data is returned as the h5py Dataset rather
+        than being read into memory.
         """
         # get data
         dset = group['data']
-        data = dset[:]
+        data = dset if lazy else dset[:]
         units = dset.attrs['units']
         rank = len(data.shape)
 
@@ -649,6 +731,11 @@ class Array(Node):
 
 # List subclass for accessing data slices with a dict
 class Labels(list):
+    """
+    A list of slice labels which keeps a dictionary mapping each label to
+    its index, for fast lookups by label.
+    """
+    __slots__ = ('_dict',)
 
     def __init__(self,x=[]):
         list.__init__(self,x)
@@ -661,8 +748,20 @@ class Labels(list):
         self._dict[label] = idx
 
     def setup_labels_dict(self):
-        self._dict = {}
-        for idx,label in enumerate(self):
-            self._dict[label] = idx
+        self._dict = {label:idx for idx,label in enumerate(self)}
+
+    def bulk_relabel(self,new_labels):
+        """
+        Replaces all the labels at once, rebuilding the lookup dictionary
+        in a single pass.
+
+        Accepts:
+            new_labels (list): the new labels; must have the same length
+                as the current labels
+        """
+        assert(len(new_labels) == len(self)), \
+            f"expected {len(self)} labels, received {len(new_labels)}"
+        list.__setitem__(self,slice(None),new_labels)
+        self.setup_labels_dict()
 
 
@@ -4,10 +4,9 @@
 # themselves EMD base classes and can therefore be nested in other custom
 # classes themselves.
 
-import h5py
 
 from emdfile.classes.tree import Node,Root
-from emdfile.classes.utils import _get_class
+from emdfile.classes.utils import _get_class, _emd_group_keys
 
 class Custom(Node):
     """
@@ -43,8 +42,7 @@ class Custom(Node):
         a {name:instance} dictionary of {attribute name : class instance}
         pairs from all 'custom_' subgroups
         """
-        groups = [g for g in group.keys() if isinstance(group[g],h5py.Group)]
-        groups = [g for g in groups if 'emd_group_type' in group[g].attrs.keys()]
+        groups = _emd_group_keys(group)
         groups = [g for g in groups if group[g].attrs['emd_group_type'][:7]=='custom_']
         dic = {}
         for g in groups:
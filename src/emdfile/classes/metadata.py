@@ -3,6 +3,8 @@ from numbers import Number
 from typing import Optional
 from os.path import basename
 
+from emdfile.classes.utils import _tag_group
+
 
 
 class Metadata:
@@ -93,9 +95,12 @@ class Metadata:
             group (h5py Group)
         """
         # Make a new group
-        grp = group.create_group(self.name)
-        grp.attrs.create("emd_group_type","metadata")
-        grp.attrs.create("python_class",self.__class__.__name__)
+        grp = group.create_group(self.name,track_order=False)
+        _tag_group(
+            grp,
+            emd_group_type = "metadata",
+            python_class = self.__class__.__name__
+        )
 
         # Save data
         for k,v in self._params.items():
@@ -138,7 +143,7 @@ class Metadata:
 
                 # of tuples
                 elif any([isinstance(v[i], tuple) for i in range(len(v))]):
-                    dset_grp = grp.create_group(k)
+                    dset_grp = grp.create_group(k,track_order=False)
                     dset_grp.attrs['type'] = np.string_('tuple_of_tuples')
                     dset_grp.attrs['length'] = len(v)
                     for i,x in enumerate(v):
@@ -148,7 +153,7 @@ class Metadata:
 
                 # of arrays
                 elif isinstance(v[0], np.ndarray):
-                    dset_grp = grp.create_group(k)
+                    dset_grp = grp.create_group(k,track_order=False)
                     dset_grp.attrs['type'] = np.string_('tuple_of_arrays')
                     dset_grp.attrs['length'] = len(v)
                     for i,ar in enumerate(v):
@@ -159,7 +164,7 @@ class Metadata:
 
                 # of strings
                 elif isinstance(v[0], str):
-                    dset_grp = grp.create_group(k)
+                    dset_grp = grp.create_group(k,track_order=False)
                     dset_grp.attrs['type'] = np.string_('tuple_of_strings')
                     dset_grp.attrs['length'] = len(v)
                     for i,s in enumerate(v):
@@ -181,7 +186,7 @@ class Metadata:
 
                 # of arrays
                 elif isinstance(v[0], np.ndarray):
-                    dset_grp = grp.create_group(k)
+                    dset_grp = grp.create_group(k,track_order=False)
                     dset_grp.attrs['type'] = np.string_('list_of_arrays')
                     dset_grp.attrs['length'] = len(v)
                     for i,ar in enumerate(v):
@@ -192,7 +197,7 @@ class Metadata:
 
                 # of strings
                 elif isinstance(v[0], str):
-                    dset_grp = grp.create_group(k)
+                    dset_grp = grp.create_group(k,track_order=False)
                     dset_grp.attrs['type'] = np.string_('list_of_strings')
                     dset_grp.attrs['length'] = len(v)
                     for i,s in enumerate(v):
@@ -225,7 +230,7 @@ class Metadata:
         """
         # Validate inputs
         er = f"Group {group} is not a valid EMD Metadata group"
-        assert("emd_group_type" in group.attrs.keys()), er
+        assert("emd_group_type" in group.attrs), er
         assert(group.attrs["emd_group_type"] == "metadata"), er
 
         # Get data
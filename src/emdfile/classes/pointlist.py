@@ -8,6 +8,7 @@ from typing import Optional
 from os.path import basename
 
 from emdfile.classes.tree import Node
+from emdfile.classes.utils import _choose_chunks
 
 
 class PointList(Node):
@@ -46,6 +47,18 @@ class PointList(Node):
 
 
     # properties
+    @property
+    def data(self):
+        return self._raw[:self._length]
+    @data.setter
+    def data(self, x):
+        # `_raw` is a backing buffer which may be longer than the data
+        # it holds, letting `add` append without reallocating each call
+        self._raw = np.atleast_1d(x)
+        self._length = self._raw.shape[0]
+        self._capacity = self._length
+        self._soa = None
+
     @property
     def dtype(self):
         return self._dtype
@@ -58,8 +71,9 @@ class PointList(Node):
         return self._fields
     @fields.setter
     def fields(self, x):
-        self.data.dtype.names = x
+        self._raw.dtype.names = x
         self._fields = x
+        self._soa = None
 
     @property
     def types(self):
@@ -67,9 +81,25 @@ class PointList(Node):
 
     @property
     def length(self):
-        return np.atleast_1d(self.data).shape[0]
+        return self._length
+
 
 
+    def soa(self, refresh=False):
+        """
+        Returns a dictionary of {field : array} with a contiguous copy of
+        each field. Per-field operations on these arrays (sums, histograms,
+        etc.) read memory with unit stride, unlike the fields of the
+        structured `data` array, which are interleaved record by record.
+
+        The dictionary is built on the first call and reused until points
+        are added, removed, or sorted. Edits made in place to `data` are
+        not tracked; after these, call `soa(refresh=True)`.
+        """
+        if self._soa is None or refresh:
+            self._soa = {f:np.ascontiguousarray(self.data[f]) for f in self.fields}
+        return self._soa
+
 
     ## Add, remove, sort data
 
@@ -80,27 +110,51 @@ class PointList(Node):
         assert self.dtype == data.dtype, "Error: dtypes must agree"
         if isinstance(data,PointList):
             data = data.data
-        self.data = np.append(self.data, data)
+        data = np.ravel(data)
+        length = self._length + data.shape[0]
+        if length > self._capacity:
+            self._grow(length)
+        self._raw[self._length:length] = data
+        self._length = length
+        self._soa = None
+
+    def _grow(self, length):
+        """
+        Reallocates the backing buffer to hold at least `length` points,
+        at least doubling its capacity so that repeated calls to `add` cost
+        amortized O(1) per point.
+        """
+        capacity = max(2*self._capacity, length)
+        raw = np.empty(capacity, dtype=self._raw.dtype)
+        raw[:self._length] = self._raw[:self._length]
+        self._raw = raw
+        self._capacity = capacity
 
     def remove(self, mask):
-        """ Removes points wherever mask==True
+        """ Removes points wherever mask==True. `mask` must be 1D.
         """
-        assert np.atleast_1d(mask).shape[0] == self.length, "deletemask must be same length as the data"
-        inds = mask.nonzero()[0]
-        self.data = np.delete(self.data, inds)
+        assert len(mask) == self._length, "deletemask must be same length as the data"
+        mask = np.asarray(mask, dtype=bool)
+        self.data = self.data[~mask]
 
     def sort(self, field, order='ascending'):
         """
         Sorts the point list according to field,
         which must be a field in self.dtype.
         order should be 'descending' or 'ascending'.
+        Points with equal values keep their relative order.
         """
         assert field in self.fields
         assert (order=='descending') or (order=='ascending')
+        # sort the key column alone, then gather the records, which
+        # also leaves the data contiguous
+        key = self.data[field]
         if order=='ascending':
-            self.data = np.sort(self.data, order=field)
+            inds = np.argsort(key, kind='stable')
         else:
-            self.data = np.sort(self.data, order=field)[::-1]
+            # sorting the reversed key, then reversing, keeps ties in order
+            inds = (self._length-1 - np.argsort(key[::-1], kind='stable'))[::-1]
+        self.data = self.data[inds]
 
 
     ## Copy, copy+modify PointList
@@ -134,8 +188,7 @@ class PointList(Node):
             dtype.append((f,t))
 
         data = np.zeros(self.length, dtype=dtype)
-        for f in self.fields:
-            data[f] = np.copy(self.data[f])
+        data[list(self.fields)] = self.data
 
         return PointList(data=data, name=name)
 
@@ -160,7 +213,7 @@ class PointList(Node):
         for d,f in zip(data, _fields):
             newdata[f] = d
 
-        self.data = np.append(self.data,newdata)
+        self.add(newdata)
 
 
 
@@ -189,7 +242,22 @@ class PointList(Node):
     # HDF5 i/o
 
     # write
-    def to_h5(self,group):
+    def _hash_state(self):
+        # hash the points in use, not the spare capacity or field cache
+        state = Node._hash_state(self)
+        for k in ('_raw','_length','_capacity','_soa'):
+            del(state[k])
+        state['data'] = self.data
+        return state
+
+    def to_h5(
+        self,
+        group,
+        chunks = 'auto',
+        compression = None,
+        compression_opts = None,
+        shuffle = True
+        ):
         """
         Takes an h5py Group instance and creates a subgroup containing
         this PointList, tags indicating its EMD type and Python class,
@@ -197,6 +265,16 @@ class PointList(Node):
 
         Accepts:
             group (h5py Group)
+            chunks ('auto', None, True, or tuple): chunk shape of each field's
+                dataset. 'auto' picks chunks of ~1 MiB, and stores fields
+                smaller than this contiguously. Other values are passed
+                to h5py.
+            compression (None or str): HDF5 compression filter for the
+                fields, e.g. 'gzip' or 'lzf'. Note that 'lzf' is only
+                available to readers using h5py.
+            compression_opts: options for the compression filter, e.g. the
+                gzip level, 0-9
+            shuffle (bool): if compressing, apply the shuffle filter first
 
         Returns:
             (h5py Group) the new pointlist's group
@@ -208,7 +286,12 @@ class PointList(Node):
         for f,t in zip(self.fields,self.types):
             group_current_field = grp.create_dataset(
                 f,
-                data = self.data[f]
+                data = self.data[f],
+                chunks = _choose_chunks((self._length,),t.itemsize) \
+                    if chunks == 'auto' else chunks,
+                compression = compression,
+                compression_opts = compression_opts,
+                shuffle = shuffle and compression is not None
             )
             group_current_field.attrs.create("dtype", np.string_(t))
 
@@ -224,20 +307,24 @@ class PointList(Node):
         """
         Returns a dictionary of args/values to pass to the class constructor
         """
-        # Get PointList metadata
-        fields = list(group.keys())
-        fields = [f for f in fields if isinstance(group[f],h5py.Dataset)]
-        dtype = []
-        for field in fields:
-            curr_dtype = group[field].attrs["dtype"].decode('utf-8')
-            dtype.append((field,curr_dtype))
-        length = len(group[fields[0]])
+        # Get PointList metadata, opening each field's dataset once
+        fields = [(f,d) for f,d in group.items() if isinstance(d,h5py.Dataset)]
+        dtype = [(f,d.attrs["dtype"].decode('utf-8')) for f,d in fields]
+        length = len(fields[0][1])
 
         # Get data
-        data = np.zeros(length,dtype=dtype)
+        data = np.empty(length,dtype=dtype)
         if length > 0:
-            for field in fields:
-                data[field] = np.array(group[field])
+            # read_direct needs a contiguous destination, which a field of
+            # a structured array is not, so fields are read into a scratch
+            # buffer shared by all fields of the same type and copied in
+            buffers = {}
+            for f,d in fields:
+                t = data.dtype[f]
+                if t not in buffers:
+                    buffers[t] = np.empty(length,dtype=t)
+                d.read_direct(buffers[t])
+                data[f] = buffers[t]
 
         # make args dictionary and return
         return {
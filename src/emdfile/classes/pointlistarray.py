@@ -119,8 +119,7 @@ class PointListArray(Node):
                 # Copy old data into a new structured array
                 pl_old = self.get_pointlist(i,j)
                 data = np.zeros(pl_old.length, np.dtype(dtype))
-                for f in self.fields:
-                    data[f] = np.copy(pl_old.data[f])
+                data[list(self.fields)] = pl_old.data
 
                 # Write into new pointlist
                 pl_new = new_pla.get_pointlist(i,j)
@@ -3,7 +3,7 @@ from os.path import basename
 import h5py
 
 from emdfile.classes import Metadata
-from emdfile.classes.utils import EMD_group_types, _get_class
+from emdfile.classes.utils import EMD_group_types, _get_class, _tag_group
 
 
 class Node:
@@ -473,7 +473,7 @@ class Node:
 
 
     @classmethod
-    def from_h5(cls,group):
+    def from_h5(cls,group,**kwargs):
         """
         Takes an h5py Group which is open in read mode. Confirms that a
         a Node of this name exists in this group, and loads and returns it
@@ -481,18 +481,19 @@ class Node:
 
         Accepts:
             group (h5py Group)
+            **kwargs: passed to the class's `_get_constructor_args`
 
         Returns:
             (Node)
         """
         # Validate inputs
         er = f"Group {group} is not a valid EMD node"
-        assert("emd_group_type" in group.attrs.keys()), er
+        assert("emd_group_type" in group.attrs), er
         assert(group.attrs["emd_group_type"] in EMD_group_types)
 
         # Make dict of args to build a new generic class instance
         # then make the new class instance
-        args = cls._get_constructor_args(group)
+        args = cls._get_constructor_args(group,**kwargs)
         node = cls(**args)
 
         # some classes needed to be first instantiated, then populated with data
@@ -525,6 +526,16 @@ class Node:
 
 
     # write
+    def _hash_state(self):
+        """
+        Returns a dict of the attributes which determine this node's content,
+        from which content hashes are computed when writing. Excludes the
+        attributes placing the node in its tree. Subclasses holding derived
+        or cached attributes should exclude them too.
+        """
+        return {k:v for k,v in vars(self).items()
+            if k not in ('_branch','_root','_treepath')}
+
     def to_h5(self,group):
         """
         Takes an h5py Group instance and creates a subgroup containing
@@ -541,16 +552,19 @@ class Node:
         assert(self.__class__._emd_group_type in EMD_group_types)
 
         # Make group, add tags
-        grp = group.create_group(self.name)
-        grp.attrs.create("emd_group_type",self.__class__._emd_group_type)
-        grp.attrs.create("python_class",self.__class__.__name__)
+        grp = group.create_group(self.name,track_order=False)
+        _tag_group(
+            grp,
+            emd_group_type = self.__class__._emd_group_type,
+            python_class = self.__class__.__name__
+        )
 
         # add metadata
         items = self._metadata.items()
         if len(items)>0:
             # create container group for metadata dictionaries
-            grp_metadata = grp.create_group('metadatabundle')
-            grp_metadata.attrs.create("emd_group_type","metadatabundle")
+            grp_metadata = grp.create_group('metadatabundle',track_order=False)
+            _tag_group(grp_metadata,emd_group_type="metadatabundle")
             for k,v in items:
                 # add each Metadata instance
                 self._metadata[k].name = k
@@ -628,6 +642,9 @@ class Branch:
     # Enables retrieving items at top level,
     # or nested items using 'node1/node2' syntax
     def __getitem__(self,x):
+        # top level keys are looked up directly
+        if x in self._dict:
+            return self._dict[x]
         l = x.split('/')
         try:
             l.remove('')
@@ -655,6 +672,11 @@ class Branch:
         del(self._dict[x])
 
 
+    # number of top level items; empty Branches are falsey
+    def __len__(self):
+        return len(self._dict)
+
+
     # return the top level keys and items
     def keys(self):
         return self._dict.keys()
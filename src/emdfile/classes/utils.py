@@ -2,6 +2,9 @@
 import inspect
 import types
 import sys
+import math
+import numpy as np
+import h5py
 
 
 # Define the EMD group types
@@ -26,6 +29,82 @@ EMD_group_types = EMD_base_group_types + EMD_data_group_types + EMD_custom_group
 
 
 
+def _choose_chunks(shape, itemsize, target_bytes=1<<20):
+    """
+    Returns a chunk shape of roughly `target_bytes` for an HDF5 dataset with
+    `shape` and `itemsize`. Trailing axes are kept whole and leading axes are
+    chunked first, so that each chunk holds complete trailing slices (e.g.
+    whole diffraction patterns of a 4D-STEM scan). Returns None, indicating
+    a contiguous layout, for datasets no larger than a single chunk.
+    """
+    if math.prod(shape)*itemsize <= target_bytes:
+        return None
+    chunks = list(shape)
+    for n in range(len(shape)):
+        inner = math.prod(shape[n+1:])*itemsize
+        if inner <= target_bytes:
+            chunks[n] = min(shape[n], max(1, target_bytes//inner))
+            break
+        chunks[n] = 1
+    return tuple(chunks)
+
+
+
+
+def _emd_group_keys(group):
+    """
+    Returns a list of the names of the EMD groups directly inside `group`,
+    in the order of group.keys(), i.e. in creation order for groups that
+    track it and in name order otherwise. Iterates over the links and
+    checks for the group type attribute with the low level API, rather
+    than opening each child and listing its attributes. Only groups are
+    kept, and links which can't be resolved, e.g. dangling soft or external
+    links, are skipped.
+    """
+    gid = group.id
+    # a File's own creation property list doesn't hold its root group's
+    # link order, so for Files look at the root group's
+    if isinstance(gid,h5py.h5f.FileID):
+        gcpl = h5py.h5g.open(gid,b'/').get_create_plist()
+    else:
+        gcpl = gid.get_create_plist()
+    if gcpl.get_link_creation_order() & h5py.h5p.CRT_ORDER_INDEXED:
+        idx_type = h5py.h5.INDEX_CRT_ORDER
+    else:
+        idx_type = h5py.h5.INDEX_NAME
+    keys = []
+    def _check(name):
+        try:
+            if h5py.h5a.exists(gid,b"emd_group_type",obj_name=name) and \
+                    h5py.h5o.get_info(gid,name).type == h5py.h5o.TYPE_GROUP:
+                keys.append(name.decode())
+        except RuntimeError:
+            pass
+    gid.links.iterate(_check,idx_type=idx_type)
+    return keys
+
+
+
+
+# the type and dataspace of the string attributes tagging EMD groups
+_STR_DTYPE = h5py.string_dtype()
+_STR_TYPE = h5py.h5t.py_create(_STR_DTYPE,logical=True)
+_SCALAR_SPACE = h5py.h5s.create(h5py.h5s.SCALAR)
+
+def _tag_group(grp,**tags):
+    """
+    Adds each keyword argument to the h5py Group `grp` as a string attribute.
+    Uses the low level API with a shared string type and dataspace, rather
+    than having grp.attrs.create infer and build them for every attribute.
+    """
+    gid = grp.id
+    for name,value in tags.items():
+        attr = h5py.h5a.create(gid,name.encode(),_STR_TYPE,_SCALAR_SPACE)
+        attr.write(np.array(value,dtype=_STR_DTYPE))
+
+
+
+
 def _get_class(grp):
     """
     Returns a dictionary of Class constructors from corresponding strings
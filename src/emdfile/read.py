@@ -6,6 +6,8 @@ import pathlib
 from os.path import exists, splitext, basename, dirname, join
 from typing import Union, Optional
 import warnings
+import inspect
+from contextlib import nullcontext
 
 
 # Classes
@@ -13,10 +15,12 @@ from emdfile.classes import (
     Root,
     Node,
     RootedNode,
-    Metadata
+    Metadata,
+    Array
 )
 from emdfile.classes.utils import (
     _get_class,
+    _emd_group_keys,
     EMD_data_group_types
 )
 
@@ -26,34 +30,45 @@ from emdfile.classes.utils import (
 
 # read utilities
 
+def _open_or_pass(filepath):
+    """
+    Returns a context manager yielding an h5py File. If `filepath` is a path,
+    opens it in read mode and closes it on exit; if it's an already open h5py
+    File or Group, yields it and leaves it open.
+    """
+    if isinstance(filepath,h5py.Group):
+        return nullcontext(filepath.file)
+    return h5py.File(filepath,'r')
+
 def _get_EMD_rootgroups(filepath):
     """
-    Returns a list of root groups in an EMD 1.0 file.
+    Returns a list of root groups in an EMD 1.0 file. `filepath` may be a
+    path or an open h5py File.
     """
     rootgroups = []
-    with h5py.File(filepath,'r') as f:
-        for key in f.keys():
-            if 'emd_group_type' in f[key].attrs:
-                if f[key].attrs['emd_group_type'] == 'root':
-                    rootgroups.append(key)
+    with _open_or_pass(filepath) as f:
+        for key in _emd_group_keys(f):
+            if f[key].attrs['emd_group_type'] == 'root':
+                rootgroups.append(key)
     return rootgroups
 
 def _is_EMD_file(filepath):
     """
-    Returns True iff filepath points to a valid EMD 1.0 file.
+    Returns True iff filepath points to a valid EMD 1.0 file. `filepath` may
+    be a path or an open h5py File.
     """
     # check for the 'emd_group_type'='file' attribute
-    with h5py.File(filepath,'r') as f:
+    with _open_or_pass(filepath) as f:
         try:
-            assert('emd_group_type' in f.attrs.keys())
-            assert('version_major' in f.attrs.keys())
-            assert('version_minor' in f.attrs.keys())
+            assert('emd_group_type' in f.attrs)
+            assert('version_major' in f.attrs)
+            assert('version_minor' in f.attrs)
             assert(f.attrs['emd_group_type'] == 'file')
             assert(f.attrs['version_major'] == 1)
             assert(f.attrs['version_minor'] == 0)
         except AssertionError:
             return False
-    rootgroups = _get_EMD_rootgroups(filepath)
+        rootgroups = _get_EMD_rootgroups(f)
     if len(rootgroups)>0:
         return True
     else:
@@ -67,7 +82,7 @@ def _get_EMD_version(filepath, rootgroup=None):
     with h5py.File(filepath,'r') as f:
         v_major = int(f.attrs['version_major'])
         v_minor = int(f.attrs['version_minor'])
-        if 'version_release' in f.attrs.keys():
+        if 'version_release' in f.attrs:
             v_release = int(f.attrs['version_release'])
         else:
             v_release = 0
@@ -111,6 +126,7 @@ def read(
     filepath,
     emdpath: Optional[str] = None,
     tree: Optional[Union[bool,str]] = True,
+    lazy: bool = False,
     **legacy_options,
     ):
     """
@@ -132,6 +148,16 @@ def read(
             under this node as above, but does not load the node itself.
             If `emdpath` points to a root node, setting `tree` to `'branch`'
             or `True` are equivalent - both return the whole data tree.
+        lazy (bool): if True, the data of any Arrays is not loaded into
+            memory. Instead each Array's `.data` is the h5py Dataset, and
+            slicing or indexing into it reads from the file. The file is
+            kept open read-only until the last such Array is garbage
+            collected, and until then saving to the same path in any mode
+            fails with an OSError. To write back to the file, first delete
+            the returned tree, or load the data into memory, e.g. with
+            `array.data = array.data[...]` for each lazy Array. Array
+            subclasses whose `_get_constructor_args` has no `lazy` argument
+            are read eagerly.
 
     Returns:
         (Root) returns a Root instance containing (1) any root metadata from
@@ -177,8 +203,10 @@ def read(
 
 
 
-    # Open the h5 file
-    with h5py.File(filepath,'r') as f:
+    # Open the h5 file. For lazy reads the file is left open, and closes
+    # when the last Dataset referencing it is garbage collected
+    f = h5py.File(filepath,'r')
+    with (nullcontext(f) if lazy else f):
 
         # Find the root group
         assert(rootpath in f.keys()), f"Error: root group {rootpath} not found"
@@ -206,7 +234,7 @@ def read(
         # ...if the whole tree was requested
         if nodegroup is rootgroup and tree in (True,'branch'):
             # build the tree
-            n = _populate_tree(root,rootgroup)
+            n = _populate_tree(root,rootgroup,lazy=lazy)
             # return...
             if n == 1:
                 # ...if there's one node, return it
@@ -224,22 +252,22 @@ def read(
         # ...if a single node was requested
         elif tree is False:
             # read the node
-            node = _read_single_node(nodegroup)
+            node = _read_single_node(nodegroup,lazy=lazy)
             # build the tree and return
             root.add_to_tree(node)
 
         # ...if a branch was requested
         elif tree is True:
             # read source node and add to tree
-            node = _read_single_node(nodegroup)
+            node = _read_single_node(nodegroup,lazy=lazy)
             root.add_to_tree(node)
             # build the tree
-            _populate_tree(node,nodegroup)
+            _populate_tree(node,nodegroup,lazy=lazy)
 
         # ...if `tree == 'branch'`
         else:
             # build the tree
-            _populate_tree(root,nodegroup)
+            _populate_tree(root,nodegroup,lazy=lazy)
             node = root
 
     # Return
@@ -251,17 +279,35 @@ def read(
 
 # group / tree reading utilities
 
-def _read_single_node(grp):
+def _read_single_node(grp,lazy=False):
     """
     Determines the class type of the h5py Group `grp`, then
     instantiates and returns an instance of the class with
-    this group's data and metadata
+    this group's data and metadata. If `lazy` is True, Arrays
+    are read without loading their data.
     """
     __class__ = _get_class(grp)
+    if lazy and issubclass(__class__,Array) and _reads_lazily(__class__):
+        return __class__.from_h5(grp,lazy=True)
     data = __class__.from_h5(grp)
     return data
 
-def _populate_tree(node,group,count=0):
+def _reads_lazily(cls):
+    """
+    Returns True if the Array class `cls` supports lazy reads, i.e. if its
+    `_get_constructor_args` accepts a `lazy` argument. Subclasses overriding
+    it with the older (cls, group) signature don't.
+    """
+    if cls not in _LAZY_CLASSES:
+        params = inspect.signature(cls._get_constructor_args).parameters
+        _LAZY_CLASSES[cls] = 'lazy' in params or any(
+            p.kind == p.VAR_KEYWORD for p in params.values())
+    return _LAZY_CLASSES[cls]
+
+# caches _reads_lazily by class
+_LAZY_CLASSES = {}
+
+def _populate_tree(node,group,count=0,lazy=False):
     """
     `node` is a Node and `group` is its parallel h5py Group.
     Reads the tree underneath this nodegroup in the h5 file and adds it
@@ -270,14 +316,13 @@ def _populate_tree(node,group,count=0):
 
     Returns the number of new nodes added to the tree
     """
-    keys = [k for k in group.keys() if isinstance(group[k],h5py.Group)]
-    keys = [k for k in keys if 'emd_group_type' in group[k].attrs.keys()]
+    keys = _emd_group_keys(group)
     keys = [k for k in keys if group[k].attrs['emd_group_type'] in \
         EMD_data_group_types]
 
     for key in keys:
         #print(f"Reading group {group[key].name}")
-        new_node = _read_single_node(group[key])
+        new_node = _read_single_node(group[key],lazy=lazy)
         count += 1
         # Handle RootedNodes, which need to be grafted rather than added
         if isinstance(new_node,RootedNode):
@@ -288,7 +333,8 @@ def _populate_tree(node,group,count=0):
         _populate_tree(
             new_node,
             group[key],
-            count = count
+            count = count,
+            lazy = lazy
         )
     return count
 
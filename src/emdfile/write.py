@@ -4,17 +4,46 @@ import h5py
 import numpy as np
 from warnings import warn
 from os.path import exists,basename
-from os import remove
+from collections import deque
+from functools import lru_cache
+import posixpath
+from os import remove,replace
 from uuid import uuid4
-from emdfile.read import _is_EMD_file, _get_EMD_rootgroups
-from emdfile.classes.utils import EMD_data_group_types
+from hashlib import blake2b
+from emdfile.read import _is_EMD_file, _get_EMD_rootgroups, _open_or_pass
+from emdfile.classes.utils import (
+    EMD_data_group_types,
+    _emd_group_keys,
+    _tag_group
+)
 from emdfile.classes import (
     Node,
     Root,
     Array,
+    PointList,
     Metadata
 )
 
+# keys for each write mode
+_WRITE_MODES = frozenset({'w','write'})
+_OVERWRITE_MODES = frozenset({'o','overwrite'})
+_APPEND_MODES = frozenset({'a','+','append'})
+_APPENDOVER_MODES = frozenset({'oa','ao','o+','+o','appendover'})
+_APPEND_ANY_MODES = _APPEND_MODES | _APPENDOVER_MODES
+_ALL_MODES = _WRITE_MODES | _OVERWRITE_MODES | _APPEND_ANY_MODES
+
+# HDF5 cache sizes used when writing. The raw data chunk cache holds the
+# chunks of datasets being written or appended to, and the metadata cache
+# absorbs the many small object header and B-tree updates of writing a tree
+_RDCC_NBYTES = 64*1024*1024
+_RDCC_NSLOTS = 100003
+_RDCC_W0 = 0.75
+_MDC_INITIAL_SIZE = 8*1024*1024
+_MDC_MAX_SIZE = 64*1024*1024
+
+# HDF5 file format version bounds for new files
+_DEFAULT_LIBVER = ('v110','latest')
+
 
 def write(
     filepath,
@@ -22,6 +51,19 @@ def write(
     mode = 'w',
     emdpath = None,
     tree = True,
+    fs_strategy = None,
+    fs_page_size = 4*1024*1024,
+    page_buf_size = None,
+    rdcc_nbytes = _RDCC_NBYTES,
+    rdcc_nslots = _RDCC_NSLOTS,
+    rdcc_w0 = _RDCC_W0,
+    chunks = 'auto',
+    compression = None,
+    compression_opts = None,
+    shuffle = True,
+    content_hash = False,
+    compact = False,
+    libver = None,
     ):
     """
     Saves data to a .h5 file at filepath. Specific behavior depends on the
@@ -65,13 +107,14 @@ def write(
     represented in the HDF5 with the new data. Note that this function does
     not attempt to take a diff between the contents of the groups and the
     runtime data groups - it only considers the names and their locations in
-    the tree. If append or appendover mode are used and filepath is set to
+    the tree - unless `content_hash` is True, see below. If append or appendover mode are used and filepath is set to
     a location that does not already contain a file on the filesystem,
     behavior is identical to write mode. When appendover mode overwrites
     data, it is erasing the old links and creating new links to new data;
     however, the HDF5 file does not release the space on the filesystem.
-    To free up storage, set mode to 'appendover', and this function will
-    add a final step to re-write then delete the old file.
+    To free up storage, set `compact` to True, and this function will add
+    a final step which copies the file's contents to a new file at the HDF5
+    level, then replaces the old file with it.
 
     The `emdpath` argument is used to append to a specific location in an
     extant EMD file downstream of some extant root. If passed, it must point
@@ -112,48 +155,89 @@ def write(
             this argument is ignored. Indicates where in an existing EMD
             file tree to place the data. Must be a '/' delimited string
             pointing to an existing EMD file tree node.
+        fs_strategy (str or None): the HDF5 file space strategy used when
+            creating a new file. If None (default) uses the HDF5 default.
+            Set to 'page' to aggregate metadata and small raw data into
+            pages of `fs_page_size` bytes, so that readers - particularly
+            over networked or object storage - can fetch many small
+            objects with a single read. Paged files also keep track of
+            their free space, so space released when appendover replaces
+            data is reused by later writes. Ignored for existing files.
+        fs_page_size (int): the page size in bytes used when `fs_strategy`
+            is 'page'. Should be larger than the largest dataset chunk;
+            the default of 4 MiB exceeds the ~1 MiB chunks emdfile chooses
+            automatically.
+        page_buf_size (int or None): if set, the size in bytes of the page
+            buffer used when the file is open, for files using paged
+            allocation
+        rdcc_nbytes (int): the size in bytes of the raw data chunk cache
+            of each dataset, 64 MiB by default. Pass a larger value when
+            writing datasets whose chunks are written in many pieces and
+            don't fit in the cache together.
+        rdcc_nslots (int): the number of chunk cache hash table slots;
+            ideally a prime ~10 times the number of chunks in the cache
+        rdcc_w0 (float): the chunk cache preemption policy, from 0 to 1;
+            higher values evict fully written chunks first
+        chunks ('auto', None, True, or tuple): chunk shape used for the
+            data of Arrays and PointLists. 'auto' (default) picks chunks of
+            ~1 MiB and stores smaller datasets contiguously; None stores all
+            data contiguously; True lets h5py guess. A tuple is applied to
+            every dataset, so is only useful when writing a single array.
+        compression (None or str): HDF5 compression filter for the data of
+            Arrays and PointLists, e.g. 'gzip' or 'lzf'. Default is None.
+            Note that 'lzf' is only available to readers using h5py.
+        compression_opts: options for the compression filter, e.g. the
+            gzip level, 0-9
+        shuffle (bool): if compressing, apply the shuffle filter first
+        content_hash (bool): if True, tags the groups written with hashes of
+            their runtime node's content, and when appending, skips nodes
+            whose hash matches the group already in the file, and in
+            appendover mode doesn't overwrite nodes of which only the tree
+            has changed. Hashing reads all the data being written, so is
+            off by default; it pays off when the same tree is repeatedly
+            appended over with few changes.
+        compact (bool): if True and data was added to an existing file,
+            rewrites the file afterwards to release the space left behind
+            by overwritten data. Datasets are copied without being decoded
+            and re-encoded, but the whole file is still rewritten.
+        libver (None, str or tuple): the lower and upper bounds on the HDF5
+            file format versions used, passed to h5py.File. If None (default),
+            new files use ('v110','latest'), i.e. the more compact and faster
+            to search link and attribute storage of HDF5 1.10+, which is
+            required to read the file, and existing files keep the lower
+            bound recorded in their header, or 'earliest' if there is none,
+            so appending doesn't change which HDF5 versions can read them.
+            Use 'earliest' for compatibility with older HDF5 libraries.
     """
     # parse mode
-    writemode = [
-        'w',
-        'write'
-    ]
-    overwritemode = [
-        'o',
-        'overwrite'
-    ]
-    appendmode = [
-        'a',
-        '+',
-        'append'
-    ]
-    appendovermode = [
-        'oa',
-        'ao',
-        'o+',
-        '+o',
-        'appendover'
-    ]
-    allmodes = writemode + overwritemode + appendmode + appendovermode
-
     # emdpath implies append mode
-    if emdpath is not None and mode not in appendovermode:
+    if emdpath is not None and mode not in _APPENDOVER_MODES:
         mode = 'a'
 
 
     # validate `mode` and `tree` inputs
-    er = f"unrecognized mode {mode}; mode must be in {allmodes}"
-    assert(mode in allmodes), er
+    er = f"unrecognized mode {mode}; mode must be in {sorted(_ALL_MODES)}"
+    assert(mode in _ALL_MODES), er
     if tree == 'noroot':
         warn("`tree = 'noroot'` is deprecated and will be removed in a future version. Use `tree = None` instead.")
         tree = None
     assert(tree in (True,False,None)), f"invalid value {tree} passed for `tree`"
-    if mode in writemode:
+    if mode in _WRITE_MODES:
         assert(not(exists(filepath))), "A file already exists at this destination; use append or overwrite mode, or choose a new file path."
 
+    # collect the dataset storage options which differ from the defaults
+    storage_opts = {}
+    if chunks != 'auto':
+        storage_opts['chunks'] = chunks
+    if compression is not None:
+        storage_opts['compression'] = compression
+        storage_opts['compression_opts'] = compression_opts
+        storage_opts['shuffle'] = shuffle
+
 
     # validate `data` inputs, and
     # handle non-Node `data` inputs
+    roots = None
 
     # numpy array -> Array
     if isinstance(data, np.ndarray):
@@ -170,491 +254,689 @@ def write(
 
     # for lists...
     elif isinstance(data, (list,tuple)):
-        assert(all( [isinstance(x,(np.ndarray,dict,Node)) for x in data] )), \
-            "can only save np.array, dictionary, or emd.Node objects"
 
         # ...save lists of Roots as multiple EMD trees
-        if any([isinstance(x,Root) for x in data]):
-            assert(all([isinstance(x,Root) for x in data])), \
+        if any(isinstance(x,Root) for x in data):
+            assert(all(isinstance(x,Root) for x in data)), \
             "if saving a list containing a Root, all list elements must be Roots"
-            # save the first root with a call to save, then
-            # change to append mode and save other roots
-            write(
-                filepath,
-                data[0],
-                mode=mode,
-                tree=tree
-            )
-            if mode in writemode:
-                mode = 'a'
-            elif mode in overwritemode:
-                mode = 'ao'
-            for x in data[1:]:
-                write(
-                    filepath,
-                    x,
-                    mode=mode,
-                    tree=tree
-                )
-            return
+            roots = list(data)
+            # emdpath is ignored for lists of Roots
+            emdpath = None
 
-        # ...otherwise store all list elements in a single tree...
-        root = Root(name='root')
-        ar_ind,md_ind = 0,0
-        for d in data:
-
-            # ...with numpy arrays as Arrays
-            if isinstance(d,np.ndarray):
-                d = Array(name=f'np.array_{ar_ind}',data=d)
-                ar_ind += 1
-                root.add_to_tree(d)
-
-            # ...dictionaries as Metadata
-            elif isinstance(d,dict):
-                d = Metadata(name=f'dictionary_{md_ind}',data=d)
-                md_ind += 1
-                root.metadata = d
-
-            # ...and Nodes as themselves
-            else:
-                assert(isinstance(d,Node)), f"invalid data type in `data` list, {type(d)}"
-                root.add_to_tree(d)
-        data = root
-
-    # `data` should now be a Node!
-    assert(isinstance(data,Node)), f"invalid type {type(data)} found for `data`"
+        # ...otherwise store all list elements in a single tree, with numpy
+        # arrays as Arrays, dictionaries as Metadata, and Nodes as themselves
+        else:
+            root = Root(name='root')
+            counts = [0,0]
+            for d in data:
+                _list_handler(d)(root,d,counts)
+            data = root
 
-    # handle rootless data
+    # make a list of the (root,data) pairs to write
     added_a_root = False
-    if data._root is None:
-        added_a_root = True
-        root = Root(name=data.name)
-        root.add_to_tree(data)
+    if roots is not None:
+        items = [(root,root) for root in roots]
     else:
-        # get the root
-        root = data.root
+        # `data` should now be a Node!
+        assert(isinstance(data,Node)), f"invalid type {type(data)} found for `data`"
+
+        # handle rootless data
+        if data._root is None:
+            added_a_root = True
+            root = Root(name=data.name)
+            root.add_to_tree(data)
+        else:
+            # get the root
+            root = data.root
+        items = [(root,data)]
+
 
 
+    # choose how to handle conflicts; in overwrite mode these only
+    # arise between the roots in a list
+    appendover = mode in _APPENDOVER_MODES or mode in _OVERWRITE_MODES
 
     # overwrite mode - delete existing file
-    if mode in overwritemode:
+    if mode in _OVERWRITE_MODES:
         if exists(filepath):
             remove(filepath)
         mode = 'w'
 
+    # memoizes content hashes by node over this write, if hashing
+    hashes = {} if content_hash else None
+
+    # write a new file or append to an existing file,
+    # opening the file once for all the roots
+    new_file = mode in _WRITE_MODES or not exists(filepath)
+    open_kwargs = dict(
+        fs_strategy = fs_strategy,
+        fs_page_size = fs_page_size,
+        page_buf_size = page_buf_size,
+        rdcc_nbytes = rdcc_nbytes,
+        rdcc_nslots = rdcc_nslots,
+        rdcc_w0 = rdcc_w0
+    )
+    f = _open_h5(
+        filepath,
+        'w' if new_file else 'a',
+        libver = _DEFAULT_LIBVER if libver is None else libver,
+        **open_kwargs
+    )
+    # existing files keep the format version recorded in their header.
+    # Bounds can't be changed on an open file, so files recorded with other
+    # bounds than the default are reopened; opening doesn't write to them
+    if libver is None and not new_file:
+        file_libver = _get_libver(f)
+        if file_libver != _DEFAULT_LIBVER:
+            f.close()
+            f = _open_h5(
+                filepath,
+                'a',
+                libver = file_libver,
+                **open_kwargs
+            )
+    with f:
 
-
-    # write a new file
-    if mode in writemode or (
-        mode in appendmode+appendovermode and not exists(filepath)):
-
-
-        # open the file
-        with h5py.File(filepath, 'w') as f:
-
-            # write header
+        # write the header, or validate that its an EMD file
+        # and get the rootgroups
+        if new_file:
             _write_header(
                 file = f
             )
+            emd_rootgroups = set()
+            emdpath = None
+        else:
+            assert(_is_EMD_file(f)), f"{filepath} does not point to an EMD 1.0 file"
+            emd_rootgroups = set(_get_EMD_rootgroups(f))
 
-            # write the file
-            _write_from_root(
+        # write
+        for root,data in items:
+            _write_to_file(
                 file = f,
                 root = root,
                 data = data,
-                tree = tree
+                tree = tree,
+                appendover = appendover,
+                emdpath = emdpath,
+                emd_rootgroups = emd_rootgroups,
+                storage_opts = storage_opts,
+                hashes = hashes
             )
+            emd_rootgroups.add(root.name)
 
 
+    # release space left by overwritten data
+    if compact and not new_file:
+        _compact_file(filepath)
 
-    # append to an existing file
-    else:
+    # if a root was added, remove it
+    if added_a_root:
+        data._root = None
 
-        # validate that its an EMD file
-        # get the rootgroups
-        assert(_is_EMD_file(filepath)), "{filepath} does not point to an EMD 1.0 file"
-        emd_rootgroups = _get_EMD_rootgroups(filepath)
 
-        # open the file
-        with h5py.File(filepath, 'a') as f:
+    # end
+    pass
 
 
 
-            # if the root doesn't already exist and emdpath is None,
-            # do a simple write as above
-            if not(root.name in emd_rootgroups) and (emdpath is None):
 
-                _write_from_root(
-                    file = f,
-                    root = root,
-                    data = data,
-                    tree = tree
-                )
 
 
+# Utilities
 
-            # if the root doesn't already exist and emdpath is specified,
-            # append the data to the target node
-            elif not(root.name in emd_rootgroups):
 
-                # parse emdpath
-                if emdpath[0] == '/':
-                    emdpath = emdpath[1:]
-                l = emdpath.split('/')
-                rootname = l[0]
-                treepath = '/'.join(l[1:])
+# handlers placing the elements of a list passed to write() into a root.
+# `counts` holds the number of arrays and dictionaries placed so far
+def _list_to_array(root,d,counts):
+    root.add_to_tree(Array(name=f'np.array_{counts[0]}',data=d))
+    counts[0] += 1
 
-                # get the rootgroup
-                assert(rootname in f.keys()), f"No root called {rootname} found - check your `emdpath`"
-                rootgroup = f[rootname]
+def _list_to_metadata(root,d,counts):
+    root.metadata = Metadata(name=f'dictionary_{counts[1]}',data=d)
+    counts[1] += 1
 
-                # validate the emdpath
-                # set target_grp to targeted EMD node
-                where = _validate_treepath(
-                    rootgroup,
-                    treepath
-                )
-                #print(treepath)
-                #print(data._treepath)
-                #print(where)
-                #print(where[0].name)
-                if where is False:
-                    raise Exception(f"No node found at {emdpath} in the EMD tree called {rootname} - check your `emdpath`")
-                elif where[1] is False:
-                    raise Exception(f"No node found at {emdpath} in the EMD tree called {rootname} - check your `emdpath`")
-                else:
-                    target_grp = where[0]
+def _list_to_node(root,d,counts):
+    root.add_to_tree(d)
 
+_LIST_HANDLER_BASES = (
+    (np.ndarray, _list_to_array),
+    (dict, _list_to_metadata),
+    (Node, _list_to_node),
+)
 
-                # append to the tree...
+@lru_cache(maxsize=64)
+def _list_handler_for_type(t):
+    """
+    Returns the handler for list elements of type `t`, or None if there is
+    none. Cached, so each type's bases are only checked the first time it's
+    seen in a bounded number of recent types.
+    """
+    for base,handler in _LIST_HANDLER_BASES:
+        if issubclass(t,base):
+            return handler
+    return None
 
-                # ...if data is Root and tree is False
-                if isinstance(data,Root) and (tree is False):
-                    raise Exception("Incompatible inputs: if appending from a Root to an existing tree, `tree` can't be False.  Try changing `data` or `tree`.")
+def _list_handler(d):
+    """
+    Returns the handler for list element `d`
+    """
+    handler = _list_handler_for_type(type(d))
+    assert(handler is not None), \
+        f"can only save np.array, dictionary, or emd.Node objects; found {type(d)}"
+    return handler
 
-                # ...if data is Root and tree is True or None
-                elif isinstance(data,Root):
-                    _write_tree(
-                        target_grp,
-                        data
-                    )
 
-                # ...if data is a Node and tree is False
-                elif tree is False:
-                    _write_single_node(
-                        target_grp,
-                        data
-                    )
+def _open_h5(
+    filepath,
+    mode,
+    fs_strategy = None,
+    fs_page_size = None,
+    page_buf_size = None,
+    rdcc_nbytes = _RDCC_NBYTES,
+    rdcc_nslots = _RDCC_NSLOTS,
+    rdcc_w0 = _RDCC_W0,
+    libver = _DEFAULT_LIBVER
+    ):
+    """
+    Opens and returns an h5py File, with chunk and metadata caches sized
+    for writing. The file space strategy and page size only apply to newly
+    created files, i.e. mode 'w'. `libver` bounds the HDF5 file format
+    versions used for new objects.
+    """
+    kwargs = {}
+    if mode == 'w':
+        # EMD groups are read in name order, so creation order isn't tracked
+        kwargs['track_order'] = False
+        if fs_strategy is not None:
+            kwargs['fs_strategy'] = fs_strategy
+            if fs_strategy == 'page':
+                kwargs['fs_page_size'] = fs_page_size
+                # keep track of free space between sessions, so that space
+                # freed by appendover is reused by later appends
+                kwargs['fs_persist'] = True
+    if page_buf_size is not None:
+        kwargs['page_buf_size'] = page_buf_size
+    f = h5py.File(
+        filepath,
+        mode,
+        libver = libver,
+        rdcc_nbytes = rdcc_nbytes,
+        rdcc_nslots = rdcc_nslots,
+        rdcc_w0 = rdcc_w0,
+        **kwargs
+    )
+    mdc = f.id.get_mdc_config()
+    mdc.set_initial_size = True
+    mdc.initial_size = _MDC_INITIAL_SIZE
+    mdc.max_size = max(mdc.max_size,_MDC_MAX_SIZE)
+    f.id.set_mdc_config(mdc)
+    return f
 
-                # ...if data is a Node and tree is True
-                elif tree is True:
-                    target_grp = _write_single_node(
-                        target_grp,
-                        data
-                    )
-                    _write_tree(
-                        target_grp,
-                        data
-                    )
 
-                # ...if data is a Node and tree is None
-                else:
-                    _write_tree(
-                        target_grp,
-                        data
-                    )
+def _get_libver(
+    filepath
+    ):
+    """
+    Returns the libver bounds to write to an existing file with, keeping the
+    lower bound recorded in its header, or 'earliest' for files without one.
+    `filepath` may be a path or an open h5py File.
+    """
+    with _open_or_pass(filepath) as f:
+        low = f.attrs.get('libver','earliest')
+    if isinstance(low,bytes):
+        low = low.decode()
+    return (low,'latest')
+
+
+def _compact_file(
+    filepath
+    ):
+    """
+    Rewrites the file at filepath without the unused space left behind by
+    deleted or overwritten objects. Each top level object is copied to a
+    new file with H5Ocopy, which keeps dataset chunking and filters and
+    copies raw chunks without decompressing them; the new file then
+    replaces the old one.
+    """
+    # a unique name in the same directory, so no existing file is touched
+    # and the final replace stays on one filesystem
+    tmppath = f"{filepath}.{uuid4().hex}.tmp"
+    try:
+        with h5py.File(filepath,'r') as src:
+            fcpl = src.id.get_create_plist()
+            paged = fcpl.get_file_space_strategy()[0] == h5py.h5f.FSPACE_STRATEGY_PAGE
+            with _open_h5(
+                tmppath,
+                'w',
+                fs_strategy = 'page' if paged else None,
+                fs_page_size = fcpl.get_file_space_page_size(),
+                libver = _get_libver(src)
+            ) as dst:
+                for k,v in src.attrs.items():
+                    dst.attrs[k] = v
+                for name in src:
+                    src.copy(src[name],dst,name=name)
+        replace(tmppath,filepath)
+    except BaseException:
+        if exists(tmppath):
+            remove(tmppath)
+        raise
+
+
+def _write_header(
+    file
+    ):
+    from emdfile import _PROGRAM_NAME, _USER_NAME
+    file.attrs.create("emd_group_type",'file')
+    file.attrs.create("version_major",1)
+    file.attrs.create("version_minor",0)
+    #file.attrs.create("version_release",0)
+    file.attrs.create("UUID",str(uuid4()))
+    file.attrs.create("authoring_program",_PROGRAM_NAME)
+    file.attrs.create("authoring_user",_USER_NAME)
+    # record the lower bound on the file format version
+    file.attrs.create("libver",file.libver[0])
+    # record the page size of files using paged allocation, so readers
+    # can size their page buffers
+    fcpl = file.id.get_create_plist()
+    if fcpl.get_file_space_strategy()[0] == h5py.h5f.FSPACE_STRATEGY_PAGE:
+        file.attrs.create("fs_page_size",fcpl.get_file_space_page_size())
 
 
+def _write_to_file(
+    file,
+    root,
+    data,
+    tree,
+    appendover,
+    emdpath,
+    emd_rootgroups,
+    storage_opts = None,
+    hashes = None
+    ):
+    """ Writes `data` and its `root` into an open EMD 1.0 file whose root
+    groups are `emd_rootgroups`. New roots are written in full; for roots
+    already in the file, performs the diff and append/appendover described
+    in the `write` docstring.
+    """
+    # if the root doesn't already exist and emdpath is None,
+    # write the new root and its tree
+    if not(root.name in emd_rootgroups) and (emdpath is None):
+
+        _write_from_root(
+            file = file,
+            root = root,
+            data = data,
+            tree = tree,
+            storage_opts = storage_opts,
+            hashes = hashes
+        )
 
-            # if the root does exist and emdpath is None,
-            # peform diffmerge A
-            elif emdpath is None:
 
-                # choose how to handle conflicts
-                appendover = True if mode in appendovermode else False
 
-                # get the rootgroup
-                rootgroup = f[root.name]
+    # if the root doesn't already exist and emdpath is specified,
+    # append the data to the target node
+    elif not(root.name in emd_rootgroups):
 
-                # compare/append root metadata
-                _append_root_metadata(
-                    rootgroup = rootgroup,
-                    root = root,
-                    appendover = appendover
-                )
+        # parse emdpath
+        if emdpath[0] == '/':
+            emdpath = emdpath[1:]
+        l = emdpath.split('/')
+        rootname = l[0]
+        treepath = '/'.join(l[1:])
 
+        # get the rootgroup
+        assert(rootname in file), f"No root called {rootname} found - check your `emdpath`"
+        rootgroup = file[rootname]
 
-                # choose behavior and write...
-                if data is root:
-                    # ...if the data is the root
-                    if tree is True:
-                        _append_branch(
-                            rootgroup,
-                            data,
-                            appendover
-                        )
-                    else:
-                        pass
+        # validate the emdpath
+        # set target_grp to targeted EMD node
+        where = _validate_treepath(
+            rootgroup,
+            treepath
+        )
+        #print(treepath)
+        #print(data._treepath)
+        #print(where)
+        #print(where[0].name)
+        if where is False:
+            raise Exception(f"No node found at {emdpath} in the EMD tree called {rootname} - check your `emdpath`")
+        elif where[1] is False:
+            raise Exception(f"No node found at {emdpath} in the EMD tree called {rootname} - check your `emdpath`")
+        else:
+            target_grp = where[0]
 
-                else:
-                    where = _validate_treepath(
-                        rootgroup,
-                        data._treepath
-                    )
-                    # ...if the datapath is not in the H5 path
-                    if where is False:
-                        raise Exception("The data passed can't be added to it's corresponding H5 tree - check that the data's `_treepath` is present in the existing EMD file")
-                    else:
-                        where,inside = where
-                        # ...if the datapath is in the H5 path
-                        if inside is True:
-                            if tree is True:
-                                if appendover:
-                                    next_node = _overwrite_single_node(
-                                        where,
-                                        data
-                                    )
-                                else:
-                                    next_node = where
-                                _append_branch(
-                                    next_node,
-                                    data,
-                                    appendover
-                                )
-                            elif tree is False:
-                                if appendover:
-                                    next_node = _overwrite_single_node(
-                                        where,
-                                        data
-                                    )
-                                else:
-                                    pass
-                            else:
-                                _append_branch(
-                                    where,
-                                    data,
-                                    appendover
-                                )
-                        # ...if the datapath is one node beyond the H5 path
-                        else:
-                            if tree is True:
-                                new_node = _write_single_node(
-                                    where,
-                                    data
-                                )
-                                _write_tree(
-                                    new_node,
-                                    data
-                                )
-                            elif tree is False:
-                                _write_single_node(
-                                    where,
-                                    data
-                                )
-                                pass
-                            else:
-                                _write_tree(
-                                    where,
-                                    data
-                                )
-
-
-
-            # if the root does exist and emdpath is specified,
-            # peform diffmerge B
-            else:
 
-                # choose how to handle conflicts
-                appendover = True if mode in appendovermode else False
+        # append to the tree...
 
-                # parse emdpath
-                if emdpath[0] == '/':
-                    emdpath = emdpath[1:]
-                l = emdpath.split('/')
-                rootname = l[0]
-                treepath = '/'.join(l[1:])
+        # ...if data is Root and tree is False
+        if isinstance(data,Root) and (tree is False):
+            raise Exception("Incompatible inputs: if appending from a Root to an existing tree, `tree` can't be False.  Try changing `data` or `tree`.")
 
-                # get the rootgroup
-                rootgroup = f[root.name]
+        # ...if data is Root and tree is True or None
+        elif isinstance(data,Root):
+            _write_tree(
+                target_grp,
+                data,
+                storage_opts,
+                hashes
+            )
 
-                # validate the emdpath
-                # set target_grp to targeted EMD node
-                where = _validate_treepath(
-                    rootgroup,
-                    treepath
-                )
-                if where is False:
-                    raise Exception(f"No node found at {emdpath} in the EMD tree called {rootname} - check your `emdpath`")
-                elif where[1] is False:
-                    raise Exception(f"No node found at {emdpath} in the EMD tree called {rootname} - check your `emdpath`")
-                else:
-                    target_grp = where[0]
+        # ...if data is a Node and tree is False
+        elif tree is False:
+            _write_single_node(
+                target_grp,
+                data,
+                storage_opts
+            )
 
+        # ...if data is a Node and tree is True
+        elif tree is True:
+            _write_subtree(
+                target_grp,
+                data,
+                storage_opts,
+                hashes
+            )
 
-                # compare/append root metadata
-                _append_root_metadata(
-                    rootgroup = rootgroup,
-                    root = root,
-                    appendover = appendover
-                )
+        # ...if data is a Node and tree is None
+        else:
+            _write_tree(
+                target_grp,
+                data,
+                storage_opts,
+                hashes
+            )
 
 
 
-                # choose behavior and write...
+    # if the root does exist and emdpath is None,
+    # peform diffmerge A
+    elif emdpath is None:
 
-                # ...if the data is the root
-                if data is root:
+        # get the rootgroup
+        rootgroup = file[root.name]
+
+        # compare/append root metadata
+        _append_root_metadata(
+            rootgroup = rootgroup,
+            root = root,
+            appendover = appendover,
+            hashes = hashes
+        )
 
-                    # Confirm that the target node is downstream of the root...
-                    assert(rootgroup.__contains__(target_grp.name)), "Specified target node not found in the EMD file - check your emdpath."
 
-                    # get the path from source to target, then
-                    # move `data` to the target node point
-                    path_to_target = target_grp.name.replace(rootgroup.name,'')[1:]
-                    try:
-                        data = data.tree(path_to_target)
-                    except AssertionError:
-                        raise Exception("Append failure - the target EMD node exists downstream of the source EMD node, however the target is not present in the corresponding runtime tree")
-                    # write
-                    if appendover and tree in (True,False):
-                        target_grp = _overwrite_single_node(
-                            target_grp,
-                            data
+        # choose behavior and write...
+        if data is root:
+            # ...if the data is the root
+            if tree is True:
+                _append_branch(
+                    rootgroup,
+                    data,
+                    appendover,
+                    storage_opts,
+                    hashes
+                )
+            else:
+                pass
+
+        else:
+            where = _validate_treepath(
+                rootgroup,
+                data._treepath
+            )
+            # ...if the datapath is not in the H5 path
+            if where is False:
+                raise Exception("The data passed can't be added to it's corresponding H5 tree - check that the data's `_treepath` is present in the existing EMD file")
+            else:
+                where,inside = where
+                # ...if the datapath is in the H5 path
+                if inside is True:
+                    if tree is True:
+                        if appendover:
+                            next_node = _overwrite_single_node(
+                                where,
+                                data,
+                                storage_opts
+                            )
+                        else:
+                            next_node = where
+                        _append_branch(
+                            next_node,
+                            data,
+                            appendover,
+                            storage_opts,
+                            hashes
                         )
-                    if tree in (True,None):
+                    elif tree is False:
+                        if appendover:
+                            next_node = _overwrite_single_node(
+                                where,
+                                data,
+                                storage_opts
+                            )
+                        else:
+                            pass
+                    else:
                         _append_branch(
-                            target_grp,
+                            where,
                             data,
-                            appendover
+                            appendover,
+                            storage_opts,
+                            hashes
                         )
-
-
-                # ...if the data is a node...
+                # ...if the datapath is one node beyond the H5 path
                 else:
-                    # validate the source node path
-                    where = _validate_treepath(
-                        rootgroup,
-                        data._treepath
-                    )
-                    # ...if the source node is not in the H5
-                    if where is False:
-                        raise Exception("The data passed can't be appended to it's corresponding H5 tree - the source runtime node can't be matched to the existing tree")
+                    if tree is True:
+                        _write_subtree(
+                            where,
+                            data,
+                            storage_opts,
+                            hashes
+                        )
+                    elif tree is False:
+                        _write_single_node(
+                            where,
+                            data,
+                            storage_opts
+                        )
+                        pass
                     else:
-                        source_grp,inside = where
-
-                        # ...if the source node is one node beyond the H5
-                        if inside is False:
-                            # ...if it is one node past the targetted node, write
-                            if source_grp.name == target_grp.name:
-                                if tree in (True,None):
-                                    _append_branch(
-                                        target_grp,
-                                        data,
-                                        appendover
-                                    )
-                                else:
-                                    _write_single_node(
-                                        target_grp,
-                                        data
-                                    )
-                            # ...otherwise, raise an Exception
-                            else:
-                                raise Exception("The data passed can't be added to it's corresponding H5 tree - check that the data's `.tree()` path is present in the existing EMD file")
-
-                        # ...if the source node is in inside the H5
-                        else:
-                            # ...if the source node is the target node, write
-                            if source_grp.name == target_grp.name:
-                                if appendover and tree in (True,False):
-                                    target_grp = _overwrite_single_node(
-                                        target_grp,
-                                        data
-                                    )
-                                if tree in (True,None):
-                                    _append_branch(
-                                        target_grp,
-                                        data,
-                                        appendover
-                                    )
-                            # ...if the source node is one node downstream of the target, write
-                            elif basename(source_grp.name) in list(target_grp.keys()):
-                                target_grp = source_grp
-                                if appendover and tree in (True,False):
-                                    target_grp = _overwrite_single_node(
-                                        target_grp,
-                                        data
-                                    )
-                                if tree in (True,None):
-                                    _append_branch(
-                                        target_grp,
-                                        data,
-                                        appendover
-                                    )
-                            # ...if the target node is downstream of the source node...
-                            elif source_grp.__contains__(target_grp.name):
-                                # get the path from source to target, then
-                                # move `data` to the target node point
-                                path_to_target = target_grp.name.replace(source_grp.name,'')[1:]
-                                try:
-                                    data = data.tree(path_to_target)
-                                except AssertionError:
-                                    raise Exception("Append failure - the target EMD node exists downstream of the source EMD node, however the target is not present in the corresponding runtime tree")
-                                # write
-                                if appendover and tree in (True,False):
-                                    target_grp = _overwrite_single_node(
-                                        target_grp,
-                                        data
-                                    )
-                                if tree in (True,None):
-                                    _append_branch(
-                                        target_grp,
-                                        data,
-                                        appendover
-                                    )
-
-                            # ...otherwise raise an exception
-                            else:
-                                raise Exception("Append failure - target node may not be downstream of source node.  Check the emdpath and the runtime data tree.")
+                        _write_tree(
+                            where,
+                            data,
+                            storage_opts,
+                            hashes
+                        )
 
 
 
+    # if the root does exist and emdpath is specified,
+    # peform diffmerge B
+    else:
 
-    # if a root was added, remove it
-    if added_a_root:
-        data._root = None
+        # parse emdpath
+        if emdpath[0] == '/':
+            emdpath = emdpath[1:]
+        l = emdpath.split('/')
+        rootname = l[0]
+        treepath = '/'.join(l[1:])
+
+        # get the rootgroup
+        rootgroup = file[root.name]
+
+        # validate the emdpath
+        # set target_grp to targeted EMD node
+        where = _validate_treepath(
+            rootgroup,
+            treepath
+        )
+        if where is False:
+            raise Exception(f"No node found at {emdpath} in the EMD tree called {rootname} - check your `emdpath`")
+        elif where[1] is False:
+            raise Exception(f"No node found at {emdpath} in the EMD tree called {rootname} - check your `emdpath`")
+        else:
+            target_grp = where[0]
 
+        # look up the h5 names used in the path comparisons below once
+        root_name = rootgroup.name
+        tgt_name = target_grp.name
 
-    # end
-    pass
 
+        # compare/append root metadata
+        _append_root_metadata(
+            rootgroup = rootgroup,
+            root = root,
+            appendover = appendover,
+            hashes = hashes
+        )
 
 
 
+        # choose behavior and write...
 
+        # ...if the data is the root
+        if data is root:
 
-# Utilities
+            # Confirm that the target node is downstream of the root...
+            assert(tgt_name in rootgroup), "Specified target node not found in the EMD file - check your emdpath."
+
+            # get the path from source to target, then
+            # move `data` to the target node point
+            path_to_target = tgt_name.replace(root_name,'')[1:]
+            try:
+                data = data.tree(path_to_target)
+            except AssertionError:
+                raise Exception("Append failure - the target EMD node exists downstream of the source EMD node, however the target is not present in the corresponding runtime tree")
+            # write
+            if appendover and tree in (True,False):
+                target_grp = _overwrite_single_node(
+                    target_grp,
+                    data,
+                    storage_opts
+                )
+            if tree in (True,None):
+                _append_branch(
+                    target_grp,
+                    data,
+                    appendover,
+                    storage_opts,
+                    hashes
+                )
 
-def _write_header(
-    file
-    ):
-    from emdfile import _PROGRAM_NAME, _USER_NAME
-    file.attrs.create("emd_group_type",'file')
-    file.attrs.create("version_major",1)
-    file.attrs.create("version_minor",0)
-    #file.attrs.create("version_release",0)
-    file.attrs.create("UUID",str(uuid4()))
-    file.attrs.create("authoring_program",_PROGRAM_NAME)
-    file.attrs.create("authoring_user",_USER_NAME)
+
+        # ...if the data is a node...
+        else:
+            # validate the source node path
+            where = _validate_treepath(
+                rootgroup,
+                data._treepath
+            )
+            # ...if the source node is not in the H5
+            if where is False:
+                raise Exception("The data passed can't be appended to it's corresponding H5 tree - the source runtime node can't be matched to the existing tree")
+            else:
+                source_grp,inside = where
+                src_name = source_grp.name
+
+                # ...if the source node is one node beyond the H5
+                if inside is False:
+                    # ...if it is one node past the targetted node, write
+                    if src_name == tgt_name:
+                        if tree in (True,None):
+                            _append_branch(
+                                target_grp,
+                                data,
+                                appendover,
+                                storage_opts,
+                                hashes
+                            )
+                        else:
+                            _write_single_node(
+                                target_grp,
+                                data,
+                                storage_opts
+                            )
+                    # ...otherwise, raise an Exception
+                    else:
+                        raise Exception("The data passed can't be added to it's corresponding H5 tree - check that the data's `.tree()` path is present in the existing EMD file")
+
+                # ...if the source node is in inside the H5
+                else:
+                    # ...if the source node is the target node, write
+                    if src_name == tgt_name:
+                        if appendover and tree in (True,False):
+                            target_grp = _overwrite_single_node(
+                                target_grp,
+                                data,
+                                storage_opts
+                            )
+                        if tree in (True,None):
+                            _append_branch(
+                                target_grp,
+                                data,
+                                appendover,
+                                storage_opts,
+                                hashes
+                            )
+                    # ...if the source node is one node downstream of the target, write
+                    elif basename(src_name) in target_grp:
+                        target_grp = source_grp
+                        if appendover and tree in (True,False):
+                            target_grp = _overwrite_single_node(
+                                target_grp,
+                                data,
+                                storage_opts
+                            )
+                        if tree in (True,None):
+                            _append_branch(
+                                target_grp,
+                                data,
+                                appendover,
+                                storage_opts,
+                                hashes
+                            )
+                    # ...if the target node is downstream of the source node...
+                    elif tgt_name in source_grp:
+                        # get the path from source to target, then
+                        # move `data` to the target node point
+                        path_to_target = tgt_name.replace(src_name,'')[1:]
+                        try:
+                            data = data.tree(path_to_target)
+                        except AssertionError:
+                            raise Exception("Append failure - the target EMD node exists downstream of the source EMD node, however the target is not present in the corresponding runtime tree")
+                        # write
+                        if appendover and tree in (True,False):
+                            target_grp = _overwrite_single_node(
+                                target_grp,
+                                data,
+                                storage_opts
+                            )
+                        if tree in (True,None):
+                            _append_branch(
+                                target_grp,
+                                data,
+                                appendover,
+                                storage_opts,
+                                hashes
+                            )
+
+                    # ...otherwise raise an exception
+                    else:
+                        raise Exception("Append failure - target node may not be downstream of source node.  Check the emdpath and the runtime data tree.")
 
 
 def _write_from_root(
     file,
     root,
     data,
-    tree
+    tree,
+    storage_opts = None,
+    hashes = None
     ):
     """ From an open h5py File with an EMD 1.0 header, adds a new root
-    and data tree
+    and data tree. If `hashes` is a dict, tags the groups written with
+    content hashes, memoized in it.
     """
     # write the root
     rootgroup = _write_single_node(
@@ -670,87 +952,356 @@ def _write_from_root(
         else:
             _write_tree(
                 group=rootgroup,
-                data=data
+                data=data,
+                storage_opts = storage_opts,
+                hashes = hashes
             )
+            if hashes is not None:
+                _tag_content_hash(rootgroup,root,hashes)
     else:
         if tree is False:
-            grp = _write_single_node(
+            _write_single_node(
                 group = rootgroup,
-                data = data
+                data = data,
+                storage_opts = storage_opts
             )
         elif tree is True:
-            grp = _write_single_node(
+            _write_subtree(
                 group = rootgroup,
-                data = data
-            )
-            _write_tree(
-                group = grp,
-                data = data
+                data = data,
+                storage_opts = storage_opts,
+                hashes = hashes
             )
         else:
             _write_tree(
                 group = rootgroup,
-                data = data
+                data = data,
+                storage_opts = storage_opts,
+                hashes = hashes
             )
 
 
 def _write_single_node(
     group,
-    data
+    data,
+    storage_opts = None
     ):
-    grp = data.to_h5(group)
-    return grp
+    """ Writes `data` into `group`. `storage_opts` are passed to the to_h5
+    methods of Arrays and PointLists, which are the nodes storing bulk data
+    """
+    _clear_content_hash(group)
+    return _node_to_h5(group,data,storage_opts)
+
+
+def _node_to_h5(
+    group,
+    data,
+    storage_opts = None
+    ):
+    """ Writes `data` into `group` without clearing content hashes, for
+    groups which are new or were cleared already
+    """
+    if storage_opts and isinstance(data,(Array,PointList)):
+        return data.to_h5(group,**storage_opts)
+    return data.to_h5(group)
 
 
 def _write_tree(
     group,
+    data,
+    storage_opts = None,
+    hashes = None
+    ):
+    """ Writes the data tree underneath `data`; does not write `data`.
+    The tree is flattened once and written breadth first, so each level
+    of the tree is written together. If `hashes` is a dict, once the whole
+    tree is written each node in it is tagged with its content hash.
+    """
+    if not data._branch:
+        return
+    _clear_content_hash(group)
+    flat = _flatten(data)
+    groups = _write_flat([group],flat,storage_opts)
+    # tag from the leaves up, so each node's hash reuses its children's
+    if hashes is not None:
+        for i in range(len(flat)-1,0,-1):
+            _tag_content_hash(groups[i],flat[i][0],hashes)
+
+
+def _write_subtree(
+    group,
+    data,
+    storage_opts = None,
+    hashes = None
+    ):
+    """ Writes `data` and the data tree underneath it into `group`, in one
+    breadth first pass. If `hashes` is a dict, tags each node written with
+    its content hash. Returns the group holding `data`.
+    """
+    flat = _flatten(data)
+    groups = _write_flat(
+        [_write_single_node(group,data,storage_opts)],
+        flat,
+        storage_opts
+    )
+    if hashes is not None:
+        for i in range(len(flat)-1,-1,-1):
+            _tag_content_hash(groups[i],flat[i][0],hashes)
+    return groups[0]
+
+
+def _write_flat(
+    groups,
+    flat,
+    storage_opts = None
+    ):
+    """ Writes the nodes of a flattened tree, `flat`, after the first one,
+    given `groups` holding the group of the first node. Returns the list
+    of groups, now holding each node's group.
+    """
+    for node,parent in flat[1:]:
+        groups.append(_node_to_h5(groups[parent],node,storage_opts))
+    return groups
+
+
+def _flatten(
     data
     ):
-    """ Writes the data tree underneath `data`; does not write `data`
+    """ Returns a list of (node, parent index) pairs for `data` and every
+    node in its tree, in breadth first order. `data` comes first, with a
+    parent index of None; other parent indices point into the list.
     """
-    for k in data._branch.keys():
-        grp = _write_single_node(
-            group = group,
-            data = data._branch[k]
-        )
-        _write_tree(
-            grp,
-            data._branch[k]
-        )
+    flat = [(data,None)]
+    i = 0
+    while i < len(flat):
+        for k,node in flat[i][0]._branch.items():
+            flat.append((node,i))
+        i += 1
+    return flat
+
+
+# Content hashes
+#
+# When write is called with `content_hash=True`, node hashes are memoized
+# over the write in a `hashes` dict passed to the functions below, and
+# groups written together with their entire tree are tagged with a hash of
+# the runtime node's content, metadata, and tree, in a 'content_hash'
+# attribute, and with a hash of the node's content and metadata alone, in a
+# 'node_hash' attribute. When appending, runtime nodes whose content hash
+# matches the group at the same location in the file are skipped together
+# with their trees, and in appendover mode nodes whose node hash matches are
+# not overwritten, though their trees are still appended to. Writing into a
+# group clears its content hash and those of its ancestors, with or without
+# hashing enabled.
+
+def _content_hash(
+    node,
+    hashes
+    ):
+    """
+    Returns a hex string hash of a node's content, metadata and tree, or of
+    a Metadata instance, or None if any part of these can't be hashed. `hashes` is a dictionary
+    memoizing the hashes of nodes by id over a single write.
+    """
+    key = id(node)
+    if key in hashes:
+        return hashes[key]
+    hashes[key] = None  # guards against reference cycles
+    node_hash = _node_hash(node,hashes)
+    if node_hash is None:
+        return None
+    h = blake2b(digest_size=16)
+    h.update(node_hash.encode())
+    hashable = True
+    if isinstance(node,Node):
+        for k,child in node._branch.items():
+            child_hash = _content_hash(child,hashes)
+            if child_hash is None:
+                hashable = False
+                break
+            h.update(f"{k}:{child_hash}".encode())
+    hashes[key] = h.hexdigest() if hashable else None
+    return hashes[key]
+
+
+def _node_hash(
+    node,
+    hashes
+    ):
+    """
+    Returns a hex string hash of a node's content and metadata, excluding
+    its tree, or of a Metadata instance, or None if these can't be hashed.
+    Memoized in `hashes` alongside the content hashes.
+    """
+    key = (id(node),'node')
+    if key in hashes:
+        return hashes[key]
+    hashes[key] = None
+    h = blake2b(digest_size=16)
+    h.update(type(node).__name__.encode())
+    if isinstance(node,Metadata):
+        hashable = _update_hash(h,node,hashes)
+    else:
+        hashable = _update_hash(h,node._hash_state(),hashes)
+    hashes[key] = h.hexdigest() if hashable else None
+    return hashes[key]
+
+
+def _update_hash(
+    h,
+    x,
+    hashes
+    ):
+    """
+    Feeds the value `x` to the hash `h`. Returns False if `x` can't be
+    hashed, i.e. if it contains objects of an unsupported type.
+    """
+    h.update(type(x).__name__.encode())
+    if x is None or isinstance(x,(bool,int,float,complex,np.generic)):
+        h.update(repr(x).encode())
+    elif isinstance(x,str):
+        h.update(f"{len(x)}:{x}".encode())
+    elif isinstance(x,np.ndarray):
+        if x.dtype.hasobject:
+            return False
+        h.update(f"{x.dtype.descr}{x.shape}".encode())
+        h.update(np.ascontiguousarray(x).data)
+    elif isinstance(x,np.dtype):
+        h.update(str(x.descr).encode())
+    elif isinstance(x,(list,tuple)):
+        h.update(str(len(x)).encode())
+        return all(_update_hash(h,v,hashes) for v in x)
+    elif isinstance(x,dict):
+        h.update(str(len(x)).encode())
+        for k in sorted(x,key=repr):
+            if not (_update_hash(h,k,hashes) and _update_hash(h,x[k],hashes)):
+                return False
+    elif isinstance(x,Metadata):
+        return _update_hash(h,(x.name,x._params),hashes)
+    elif isinstance(x,Node) and not isinstance(x,Root):
+        node_hash = _content_hash(x,hashes)
+        if node_hash is None:
+            return False
+        h.update(node_hash.encode())
+    else:
+        return False
+    return True
+
+
+def _tag_content_hash(
+    group,
+    node,
+    hashes
+    ):
+    """ Tags a group, which must hold `node` and its entire tree, with the
+    node's content and node hashes
+    """
+    tags = {}
+    content_hash = _content_hash(node,hashes)
+    if content_hash is not None:
+        tags['content_hash'] = content_hash
+    node_hash = _node_hash(node,hashes)
+    if node_hash is not None:
+        tags['node_hash'] = node_hash
+    gid = group.id
+    for name in tags:
+        if h5py.h5a.exists(gid,name.encode()):
+            h5py.h5a.delete(gid,name.encode())
+    _tag_group(group,**tags)
+
+
+def _has_content_hash(
+    group,
+    node,
+    hashes
+    ):
+    """ Returns True if a group is tagged with the node's content hash
+    """
+    node_hash = _content_hash(node,hashes)
+    return node_hash is not None and \
+        _read_hash(group,b'content_hash') == node_hash
+
+
+def _has_node_hash(
+    group,
+    node,
+    hashes
+    ):
+    """ Returns True if a group is tagged with the node's node hash, i.e.
+    if it holds the node's content and metadata, ignoring their trees
+    """
+    node_hash = _node_hash(node,hashes)
+    return node_hash is not None and \
+        _read_hash(group,b'node_hash') == node_hash
+
+
+def _read_hash(
+    group,
+    name
+    ):
+    """ Returns the hash stored in the attribute `name` (bytes) of a group,
+    or None if there isn't one
+    """
+    gid = group.id
+    if not h5py.h5a.exists(gid,name):
+        return None
+    attr = h5py.h5a.open(gid,name)
+    buf = np.empty((),dtype=attr.dtype)
+    attr.read(buf)
+    return buf[()].decode()
+
+
+def _clear_content_hash(
+    group
+    ):
+    """ Removes the content hash of a group and its ancestors, which no
+    longer describe their contents once a group is written to
+    """
+    while h5py.h5a.exists(group.id,b'content_hash'):
+        h5py.h5a.delete(group.id,b'content_hash')
+        group = group.parent
 
 
 def _append_root_metadata(
     rootgroup,
     root,
-    appendover
+    appendover,
+    hashes = None
     ):
     # Determine if there is new group metadata
     if len(root._metadata)==0:
         return
     # Get file root metadata groups
-    metadata_groups = []
-    if "metadatabundle" not in rootgroup.keys():
-        mdbundle_group = rootgroup.create_group('metadatabundle')
+    metadata_groups = set()
+    if "metadatabundle" not in rootgroup:
+        mdbundle_group = rootgroup.create_group('metadatabundle',track_order=False)
     else:
         mdbundle_group = rootgroup['metadatabundle']
-        for k in mdbundle_group.keys():
-            if "emd_group_type" in mdbundle_group[k].attrs.keys():
-                if mdbundle_group[k].attrs["emd_group_keys"] == "metadata":
-                    metadata_groups.append(k)
-    # loop
-    for key in root._metadata:
-        # if this group already exists
-        if key in metadata_groups:
-            # overwrite it
-            if appendover:
-                del(mdbundle_group[key])
-                root._metadata[key].to_h5(mdbundle_group)
-            # or skip it
-            else:
-                pass
-        # otherwise, write it
-        else:
-            root._metadata[key].to_h5(mdbundle_group)
+        for k in _emd_group_keys(mdbundle_group):
+            if mdbundle_group[k].attrs["emd_group_type"] == "metadata":
+                metadata_groups.add(k)
+    # sort metadata into new groups, and existing groups to overwrite -
+    # in appendover mode only, and, when hashing, only if their content
+    # has changed
+    to_create = [k for k in root._metadata if k not in metadata_groups]
+    to_overwrite = [k for k in root._metadata if k in metadata_groups and
+        not (hashes is not None and
+             _has_content_hash(mdbundle_group[k],root._metadata[k],hashes))] \
+        if appendover else []
+    if not (to_create or to_overwrite):
+        return
+    # the root's own metadata is changing, so its node hash is stale too
+    _clear_content_hash(rootgroup)
+    if 'node_hash' in rootgroup.attrs:
+        del(rootgroup.attrs['node_hash'])
+    # delete all the groups being overwritten, then write
+    for key in to_overwrite:
+        del(mdbundle_group[key])
+    for key in to_overwrite + to_create:
+        md = root._metadata[key]
+        md.to_h5(mdbundle_group)
+        if hashes is not None:
+            _tag_content_hash(mdbundle_group[md.name],md,hashes)
     return
 
 
@@ -765,62 +1316,70 @@ def _validate_treepath(
     if the treepath is one node beyond the file, returns (grp, False),
     where `grp` is the final h5py Group on treepath in the file tree.
     """
-    grp_names = treepath.split('/')
-    try:
-        grp_names.remove('')
-    except ValueError:
-        pass
-    group = rootgroup
-    for i,name in enumerate(grp_names):
-        if name not in group.keys():
-            # catch for being one node beyond
-            if i == len(grp_names)-1:
-                return group, False
-            return False
-        group = group[name]
-        try:
-            assert(isinstance(group,h5py.Group))
-        except AssertionError:
+    # look up the whole path, then its parent, rather than walking the
+    # tree one level at a time
+    grp_names = [name for name in treepath.split('/') if name]
+    path = '/'.join(grp_names)
+    if not path or path in rootgroup:
+        inside = True
+    else:
+        # catch for being one node beyond
+        path = '/'.join(grp_names[:-1])
+        if path and path not in rootgroup:
             return False
-    return group, True
+        inside = False
+    group = rootgroup[path] if path else rootgroup
+    if not isinstance(group,h5py.Group):
+        return False
+    return group, inside
 
 
 def _overwrite_single_node(
     group,
-    data
+    data,
+    storage_opts = None
     ):
-    # get names
-    groupname = group.name.split('/')
-    name = groupname[-1]
-    rootname = '/'+groupname[1]
-    groupname = '/'+'/'.join(groupname[2:])
+    # get names; `treepath` is the group's path below its root group
+    groupname = group.name
+    name = posixpath.basename(groupname)
+    treepath = '/' + groupname.split('/',2)[2] if groupname.count('/') > 1 else '/'
 
     # Validate
-    assert(data.name == name), f"Can't overwrite - data/group names don't match: {data.name} != {name}"
-    assert(groupname == data._treepath), f"Can't overwrite - data/group paths dont match: {group.name != data._treepath}"
+    if data.name != name:
+        raise Exception(f"Can't overwrite - data/group names don't match: {data.name} != {name}")
+    if treepath != data._treepath:
+        raise Exception(f"Can't overwrite - data/group paths dont match: {treepath} != {data._treepath}")
 
     # Get parent group
-    parentpath = data._treepath.split('/')
-    parentpath = rootname+'/'.join(parentpath[:-1])
-    parentgroup = group.file[parentpath]
+    parentgroup = group.parent
 
-    # Rename the old group
-    parentgroup.move(name,"_tmp_"+name)
-
-    # Write the new data 
-    new_group = _write_single_node(
-        parentgroup,
-        data
-    )
+    # Rename the old group, to a name which can't clash with its siblings
+    tmpname = "_tmp_" + uuid4().hex
+    parentgroup.move(name,tmpname)
 
-    # Copy the links
-    keys = [k for k in group.keys() if "emd_group_type" in group[k].attrs.keys()]
+    # Write the new data, restoring the old group if this fails
+    try:
+        new_group = _write_single_node(
+            parentgroup,
+            data,
+            storage_opts
+        )
+    except BaseException:
+        if name in parentgroup:
+            del(parentgroup[name])
+        parentgroup.move(tmpname,name)
+        raise
+
+    # Move the links to the tree below the old group into the new group
+    keys = _emd_group_keys(group)
     keys = [k for k in keys if group[k].attrs["emd_group_type"] in EMD_data_group_types]
+    gid,new_gid = group.id,new_group.id
     for key in keys:
-        new_group[key] = group[key]
+        key = key.encode()
+        gid.move(key,key,new_gid)
 
     # Remove the old group
-    del(parentgroup["_tmp_"+name],group)
+    del(parentgroup[tmpname],group)
 
     # Return
     return new_group
@@ -829,35 +1388,57 @@ def _overwrite_single_node(
 def _append_branch(
     group,
     data,
-    appendover
+    appendover,
+    storage_opts = None,
+    hashes = None
     ):
-    groupkeys = [k for k in group.keys() if "emd_group_type" in group[k].attrs.keys()]
-    # for each node under `data`...
-    for key in data._branch.keys():
-        d = data._branch[key]
-        # ...if this node doesn't exist in the H5, do a simple write
-        if d.name not in groupkeys:
-            _write_single_node(
-                group,
-                d
-            )
-            _write_tree(
+    """ Appends the tree under `data` to `group`, writing nodes missing from
+    the H5 and descending into those present, which are overwritten in
+    appendover mode. If `hashes` is a dict, nodes whose content hash matches
+    their group are skipped, and the groups written are tagged.
+    """
+    # walk the existing groups breadth first, from `group`
+    queue = deque([(group,data)])
+    # groups holding all of their node's tree after appendover; these are
+    # tagged once everything is written, children before parents
+    to_tag = []
+    while queue:
+        group,data = queue.popleft()
+        branch = data._branch
+        # leaves have nothing to match, so skip scanning the group
+        if not branch:
+            continue
+        groupkeys = set(_emd_group_keys(group))
+        # split the nodes under `data` by whether they exist in the H5,
+        # in the branch's order
+        new,existing = [],[]
+        for key,d in branch.items():
+            (existing if key in groupkeys else new).append((key,d))
+        # for nodes which don't exist in the H5, do a simple write
+        for key,d in new:
+            _write_subtree(
                 group,
-                d
-            )
-        # otherwise, overwrite or skip it, then call this fn again
-        else:
-            if appendover:
-                next_node = _overwrite_single_node(
-                    group[key],
-                    d
-                )
-            else:
-                next_node = group[key]
-            _append_branch(
-                next_node,
                 d,
-                appendover
+                storage_opts,
+                hashes
             )
-
-
+        # for nodes which do exist...
+        for key,d in existing:
+            next_node = h5py.Group(h5py.h5g.open(group.id,key.encode()))
+            # ...skip them and their trees if their content is identical
+            if hashes is not None and _has_content_hash(next_node,d,hashes):
+                continue
+            # ...otherwise overwrite them, unless only their trees have
+            # changed, or skip them, then visit their trees
+            if appendover:
+                if hashes is None or not _has_node_hash(next_node,d,hashes):
+                    next_node = _overwrite_single_node(
+                        next_node,
+                        d,
+                        storage_opts
+                    )
+                to_tag.append((next_node,d))
+            queue.append((next_node,d))
+    if hashes is not None:
+        for grp,d in reversed(to_tag):
+            _tag_content_hash(grp,d,hashes)
@@ -45,6 +45,36 @@ def test_Array():
     )
     assert(isinstance(ar, Array))
 
+    # linear dims with a float step are expanded to exactly the axis length
+    ar = Array(
+        data = np.ones((4,7,30)),
+        dims = [
+            [0.3,0.4],
+            [0.7,0.8],
+            [1.1,1.2]
+        ]
+    )
+    for n in range(ar.rank):
+        assert(len(ar.dims[n]) == ar.shape[n])
+
+    # stacks can be sliced by label after relabeling
+    ar = Array(
+        data = np.ones((2,4,5)),
+        slicelabels = ['a','b']
+    )
+    ar.slicelabels.bulk_relabel(['c','d'])
+    assert(ar['d'].shape == (4,5))
+
+    # object dtype dim vectors of numbers are numeric
+    ar = Array(
+        data = np.ones((3,4)),
+        dims = [
+            np.array([0,1,2],dtype=object),
+            np.array([0,2],dtype=object)
+        ]
+    )
+    assert(np.array_equal(ar.dims[1],[0,2,4,6]))
+
 
 def test_PointList():
 
@@ -61,6 +91,39 @@ def test_PointList():
     )
     assert(isinstance(pointlist,PointList))
 
+    # appending points
+    data['x'] = np.arange(10)
+    pointlist = PointList(
+        data=data
+    )
+    for i in range(5):
+        pointlist.add(data[:3])
+    assert(pointlist.length == 25)
+    assert(np.array_equal(pointlist.data['x'][10:], np.tile([0,1,2],5)))
+    pointlist.add_data_by_field([np.array([7,8]),np.array([0.5,1.5])])
+    assert(pointlist.length == 27)
+    assert(np.array_equal(pointlist.data['y'][-2:], [0.5,1.5]))
+
+    # removing points
+    pointlist.remove(pointlist.data['x'] == 1)
+    assert(pointlist.length == 21)
+    assert(not np.any(pointlist.data['x'] == 1))
+
+    # contiguous per-field arrays
+    soa = pointlist.soa()
+    assert(soa['x'].flags['C_CONTIGUOUS'])
+    assert(np.array_equal(soa['y'], pointlist.data['y']))
+    assert(pointlist.soa() is soa)
+    pointlist.sort('y')
+    assert(np.array_equal(pointlist.soa()['y'], pointlist.data['y']))
+
+    # adding fields
+    new_pointlist = pointlist.add_fields([('z',float)])
+    assert(new_pointlist.fields == ('x','y','z'))
+    assert(np.array_equal(new_pointlist.data['x'], pointlist.data['x']))
+    assert(np.array_equal(new_pointlist.data['y'], pointlist.data['y']))
+    assert(not np.any(new_pointlist.data['z']))
+
 def test_PointListArray():
 
     # PointListArray class instance should:
@@ -1,11 +1,14 @@
+import pytest
 import numpy as np
-from os.path import join,exists
+from os.path import join,exists,getsize
 from os import remove
 from numpy import array_equal
+import h5py
 
 from emdfile import _TESTPATH
 from emdfile import save,read
 from emdfile.read import _is_EMD_file,_get_EMD_rootgroups
+from emdfile.classes.utils import _emd_group_keys
 from emdfile.classes import (
     Node,
     Root,
@@ -131,3 +134,301 @@ class TestEmd:
             assert(self.array2.dim_names[i] == new_array.dim_names[i])
             assert(self.array2.slicelabels[i] == new_array.slicelabels[i])
 
+    def test_array_chunks(self):
+        """ Arrays larger than a chunk are stored in chunks which keep the
+        trailing axes whole
+        """
+        ar = Array(
+            data = np.random.random((8,8,64,64))
+        )
+        save(path_h5,ar)
+        with h5py.File(path_h5,'r') as f:
+            assert(f['array/array/data'].chunks == (4,8,64,64))
+        new_array = read(path_h5)
+        assert(array_equal(ar.data,new_array.data))
+
+    def test_array_lazy(self):
+        """ Read an array without loading its data, then slice into it
+        """
+        save(path_h5,self.array2)
+        new_array = read(path_h5,lazy=True)
+        assert(isinstance(new_array.data,h5py.Dataset))
+        assert(new_array.shape == self.array2.shape)
+        assert(array_equal(new_array.data[1:3],self.array2.data[1:3]))
+        assert(array_equal(new_array.get_slice('b').data,self.array2.get_slice('b').data))
+        assert(array_equal(new_array.dims[0],self.array2.dims[0]))
+
+    def test_array_lazy_old_subclass(self):
+        """ Array subclasses without the `lazy` argument are read eagerly
+        """
+        from emdfile.read import _reads_lazily
+        class OldArray(Array):
+            @classmethod
+            def _get_constructor_args(cls,group):
+                return Array._get_constructor_args(group)
+        assert(_reads_lazily(Array))
+        assert(not _reads_lazily(OldArray))
+
+    def test_array_lazy_copy(self):
+        """ Save an array read lazily from another file; its data is copied
+        with its storage settings
+        """
+        path2 = join(dirpath,"test2.h5")
+        ar = Array(data=np.random.random((64,64,64)),name='ar')
+        save(path_h5,ar,compression='gzip')
+        new_array = read(path_h5,lazy=True)
+        if exists(path2):
+            remove(path2)
+        save(path2,new_array)
+        with h5py.File(path2,'r') as f:
+            assert(f['ar/ar/data'].compression == 'gzip')
+        assert(array_equal(read(path2).data,ar.data))
+        remove(path2)
+
+
+    def test_untracked_order(self):
+        """ Groups don't track creation order, even if h5py's default does
+        """
+        config = h5py.get_config()
+        default = config.track_order
+        config.track_order = True
+        try:
+            save(path_h5,self.array2)
+        finally:
+            config.track_order = default
+        with h5py.File(path_h5,'r') as f:
+            for grp in (f,f['array2'],f['array2/array2']):
+                assert(grp.id.get_create_plist().get_link_creation_order() == 0)
+
+    def test_paged_file(self):
+        """ Write a file with paged allocation, then append to it
+        """
+        save(path_h5,self.array,fs_strategy='page',fs_page_size=1<<20)
+        with h5py.File(path_h5,'r') as f:
+            assert(f.attrs['fs_page_size'] == 1<<20)
+        save(path_h5,self.array2,mode='a',page_buf_size=4<<20)
+        assert(_is_EMD_file(path_h5))
+        new_array = read(path_h5,emdpath='array2/array2')
+        assert(array_equal(new_array.data,self.array2.data))
+
+    def test_paged_file_reuses_space(self):
+        """ Appendover into a paged file reuses the space it frees
+        """
+        root = Root()
+        ar = Array(data=np.random.random((256,256,8)),name='ar')
+        root.tree(ar)
+        save(path_h5,root,fs_strategy='page',fs_page_size=1<<20)
+        sizes = []
+        for i in range(4):
+            ar.data = ar.data + 1
+            save(path_h5,root,mode='appendover')
+            sizes.append(getsize(path_h5))
+        assert(max(sizes[2:]) <= max(sizes[:2]))
+        assert(array_equal(read(path_h5,emdpath='root/ar').data,ar.data))
+
+    def test_compression(self):
+        """ Storage options passed to save are used for the array data
+        """
+        save(path_h5,self.array2,compression='gzip',compression_opts=4)
+        with h5py.File(path_h5,'r') as f:
+            dset = f['array2/array2/data']
+            assert(dset.compression == 'gzip')
+            assert(dset.compression_opts == 4)
+            assert(dset.shuffle)
+        new_array = read(path_h5)
+        assert(array_equal(new_array.data,self.array2.data))
+
+    def test_appendover_skips_unchanged(self):
+        """ Appendover skips nodes whose content hash matches the file, and
+        overwrites those which have changed
+        """
+        root = Root()
+        ar = Array(data=np.ones((4,4)),name='ar')
+        ar2 = Array(data=np.ones((2,2)),name='ar2')
+        ar3 = Array(data=np.ones((3,3)),name='ar3')
+        root.tree(ar)
+        ar.tree(ar2)
+        root.tree(ar3)
+        save(path_h5,root,content_hash=True)
+        with h5py.File(path_h5,'a') as f:
+            assert('content_hash' in f['root/ar'].attrs)
+            # edit the file only, so an overwrite would be detectable
+            f['root/ar/data'][0,0] = 2
+        ar3.data = ar3.data + 1
+        save(path_h5,root,mode='appendover',content_hash=True)
+        new_root = read(path_h5)
+        assert(new_root.tree('ar').data[0,0] == 2)
+        assert(array_equal(new_root.tree('ar/ar2').data,ar2.data))
+        assert(array_equal(new_root.tree('ar3').data,ar3.data))
+
+    def test_no_content_hash_by_default(self):
+        """ Without `content_hash`, writes leave no hash attributes and
+        appendover overwrites existing nodes
+        """
+        root = Root()
+        root.metadata = Metadata(name='md',data={'a':1})
+        ar = Array(data=np.ones((4,4)),name='ar')
+        root.tree(ar)
+        ar.tree(Array(data=np.ones((2,2)),name='ar2'))
+        save(path_h5,root)
+        tagged = []
+        def find_hashes(name,obj):
+            if 'content_hash' in obj.attrs or 'node_hash' in obj.attrs:
+                tagged.append(name)
+        with h5py.File(path_h5,'a') as f:
+            f.visititems(find_hashes)
+            f['root/ar/data'][0,0] = 2
+        assert(tagged == [])
+        save(path_h5,root,mode='appendover')
+        assert(read(path_h5).root.tree('ar').data[0,0] == 1)
+
+    def test_appendover_keeps_unchanged_parent(self):
+        """ Appendover doesn't rewrite a node whose own content is unchanged
+        when only its tree has changed
+        """
+        root = Root()
+        ar = Array(data=np.ones((4,4)),name='ar')
+        ar2 = Array(data=np.ones((2,2)),name='ar2')
+        root.tree(ar)
+        ar.tree(ar2)
+        save(path_h5,root,content_hash=True)
+        with h5py.File(path_h5,'a') as f:
+            assert('node_hash' in f['root/ar'].attrs)
+            f['root/ar/data'][0,0] = 2
+        ar2.data = ar2.data + 1
+        save(path_h5,root,mode='appendover',content_hash=True)
+        new_root = read(path_h5).root
+        assert(new_root.tree('ar').data[0,0] == 2)
+        assert(array_equal(new_root.tree('ar/ar2').data,ar2.data))
+
+    def test_appendover_failure_keeps_old_node(self):
+        """ If overwriting a node fails, the old node is left in place
+        """
+        root = Root()
+        ar = Array(data=np.ones((4,4)),name='ar')
+        root.tree(ar)
+        ar.tree(Array(data=np.zeros(3),name='ar2'))
+        save(path_h5,root)
+        ar.data = np.array([object()]*4)
+        try:
+            save(path_h5,root,mode='appendover')
+            assert(False), "expected the write to fail"
+        except TypeError:
+            pass
+        with h5py.File(path_h5,'r') as f:
+            assert(set(f['root'].keys()) == {'ar'})
+        new_root = read(path_h5).root
+        assert(array_equal(new_root.tree('ar').data,np.ones((4,4))))
+        assert(array_equal(new_root.tree('ar/ar2').data,np.zeros(3)))
+
+    def test_append_recurses_into_existing(self):
+        """ Appending descends into groups already in the file, adding new
+        children without rewriting the existing nodes
+        """
+        root = Root()
+        ar = Array(data=np.ones((4,4)),name='ar')
+        root.tree(ar)
+        save(path_h5,root)
+        ar.data = ar.data + 1
+        ar.tree(Array(data=np.zeros(3),name='ar2'))
+        save(path_h5,root,mode='a')
+        new_root = read(path_h5).root
+        assert(array_equal(new_root.tree('ar').data,np.ones((4,4))))
+        assert(array_equal(new_root.tree('ar/ar2').data,np.zeros(3)))
+
+    def test_append_root_metadata(self):
+        """ Appending to a root with metadata skips existing metadata in
+        append mode and overwrites it in appendover mode
+        """
+        root = Root()
+        root.metadata = Metadata(name='md',data={'a':1})
+        root.tree(Array(data=np.ones(3),name='ar'))
+        save(path_h5,root,content_hash=True)
+        root.metadata = Metadata(name='md',data={'a':2})
+        save(path_h5,root,mode='a',content_hash=True)
+        assert(read(path_h5).root.metadata['md']['a'] == 1)
+        save(path_h5,root,mode='appendover',content_hash=True)
+        assert(read(path_h5).root.metadata['md']['a'] == 2)
+        # unchanged metadata isn't rewritten
+        with h5py.File(path_h5,'a') as f:
+            assert('content_hash' in f['root/metadatabundle/md'].attrs)
+            f['root/metadatabundle/md/a'][()] = 3
+        save(path_h5,root,mode='appendover',content_hash=True)
+        assert(read(path_h5).root.metadata['md']['a'] == 3)
+
+    def test_list_of_roots(self):
+        """ Save a list of roots as separate trees in one file
+        """
+        root1,root2 = Root(name='root1'),Root(name='root2')
+        root1.tree(Array(data=np.ones(3),name='ar1'))
+        root2.tree(Array(data=np.zeros(4),name='ar2'))
+        save(path_h5,[root1,root2])
+        assert(set(_get_EMD_rootgroups(path_h5)) == {'root1','root2'})
+        save(path_h5,[root1,root2],mode='o')
+        assert(array_equal(read(path_h5,emdpath='root2/ar2').data,np.zeros(4)))
+
+    def test_list_of_mixed_types(self):
+        """ Save a list of arrays, dictionaries, and nodes in one tree
+        """
+        from collections import OrderedDict
+        ar = Array(data=np.ones(3),name='ar')
+        save(path_h5,[np.zeros(2),{'a':1},ar,np.ones(4),OrderedDict(b=2)])
+        root = read(path_h5).root
+        assert(array_equal(root.tree('np.array_1').data,np.ones(4)))
+        assert(array_equal(root.tree('ar').data,np.ones(3)))
+        assert(root.metadata['dictionary_1']['b'] == 2)
+
+    def test_list_of_invalid_type(self):
+        """ A list holding an unsupported element raises an AssertionError
+        """
+        with pytest.raises(AssertionError):
+            save(path_h5,[np.zeros(2),1],mode='o')
+
+    def test_emd_group_keys(self):
+        """ EMD child groups are listed in group.keys() order, skipping
+        links which don't resolve
+        """
+        with h5py.File(path_h5,'w') as f:
+            for grp in (f.create_group('tracked',track_order=True),
+                        f.create_group('untracked')):
+                for name in ('zeta','alpha','mid'):
+                    grp.create_group(name).attrs['emd_group_type'] = 'node'
+                grp.create_group('plain')
+                grp['dangling'] = h5py.SoftLink('/nowhere')
+                assert(_emd_group_keys(grp) == \
+                    [k for k in grp.keys() if k not in ('plain','dangling')])
+            assert(_emd_group_keys(f['tracked']) == ['zeta','alpha','mid'])
+            # datasets carrying the attribute aren't EMD groups
+            f['untracked/dset'] = np.ones(3)
+            f['untracked/dset'].attrs['emd_group_type'] = 'node'
+            assert('dset' not in _emd_group_keys(f['untracked']))
+        # and are skipped when reading
+        save(path_h5,self.array2,mode='o')
+        with h5py.File(path_h5,'a') as f:
+            f['array2/dset'] = np.ones(3)
+            f['array2/dset'].attrs['emd_group_type'] = 'array'
+        assert(array_equal(read(path_h5).data,self.array2.data))
+
+    def test_compact(self):
+        """ Compacting after appendover releases the overwritten data's space
+        """
+        root = Root()
+        ar = Array(data=np.random.random((64,64,16)),name='ar')
+        root.tree(ar)
+        save(path_h5,root)
+        ar.data = ar.data + 1
+        save(path_h5,root,mode='appendover')
+        size = getsize(path_h5)
+        ar.data = ar.data + 1
+        save(path_h5,root,mode='appendover',compact=True)
+        assert(getsize(path_h5) < size)
+        assert(_is_EMD_file(path_h5))
+        # an unrelated file at the path plus '.tmp' is left alone
+        with open(path_h5+'.tmp','w') as f:
+            f.write('keep me')
+        ar.data = ar.data + 1
+        save(path_h5,root,mode='appendover',compact=True)
+        with open(path_h5+'.tmp') as f:
+            assert(f.read() == 'keep me')
+        remove(path_h5+'.tmp')
+        assert(array_equal(read(path_h5,emdpath='root/ar').data,ar.data))
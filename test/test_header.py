@@ -134,3 +134,21 @@ class TestHeader:
 
 
 
+
+
+
+    def test_header_libver(self):
+        """ Save a file with a given file format version, and check it's
+        recorded in the header
+        """
+        save(path_h5,self.array)
+        with h5py.File(path_h5,'r') as f:
+            assert( f.attrs['libver'] == 'v110' )
+        remove(path_h5)
+        save(path_h5,self.array,libver='earliest')
+        with h5py.File(path_h5,'r') as f:
+            assert( f.attrs['libver'] == 'earliest' )
+        # appending keeps the file's format version
+        save(path_h5,Array(data=np.ones(2),name='new'),mode='a')
+        with h5py.File(path_h5,'r') as f:
+            assert( h5py.h5o.get_info(f['new/new'].id).hdr.version == 1 )